@@ -1,9 +1,420 @@
-from flask import Flask, render_template
+import io
+import os
+from datetime import datetime, timedelta
+import click
+from flask import (Flask, Response, abort, jsonify, render_template, request,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
-from database import database
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from database import (allocation, analytics, benchmarks, catalog_import,
+                      checkout, columnar, customer_sketches, daily_sales,
+                      database, export, group_commit, idempotency,
+                      line_items, migrations, monthly_sales, pagination,
+                      replenishment, reservations, scan_cache, search,
+                      stock_ledger, stock_sync, top_sellers)
 from flask import Flask
 
 app = Flask(__name__)
+app.config["SQLALCHEMY_DATABASE_URI"] = \
+    database.app.config["SQLALCHEMY_DATABASE_URI"]
+app.config["SQLALCHEMY_ENGINE_PROFILE"] = \
+    database.app.config["SQLALCHEMY_ENGINE_PROFILE"]
+app.config["GROUP_COMMIT"] = os.environ.get("GROUP_COMMIT", "0") == "1"
+app.config["HOLD_SWEEP_INTERVAL"] = int(
+    os.environ.get("HOLD_SWEEP_INTERVAL", reservations.SWEEP_INTERVAL))
+app.config["SALES_SNAPSHOT_DIR"] = os.environ.get(
+    "SALES_SNAPSHOT_DIR", os.path.join(app.instance_path, "sales_snapshot"))
+database.db.init_app(app)
+database.install_engine_profile(app)
+
+PRODUCT_FIELDS = {
+    'product_name': catalog_import.parse_text,
+    'price': catalog_import.parse_money,
+    'cost_price': catalog_import.parse_money,
+    'barcode': catalog_import.parse_text,
+    'category': catalog_import.parse_text,
+    'description': catalog_import.parse_text,
+    'stock_quantity': catalog_import.parse_count,
+}
+NULLABLE_PRODUCT_FIELDS = ('barcode', 'category', 'description')
+SALE_FIELDS = ('customer_id', 'user_id', 'payment_method', 'warehouse_id',
+               'notes')
+ORDER_FIELDS = ('customer_id', 'user_id', 'payment_method', 'notes')
+SALE_REFERENCES = {'customer_id': database.Customer,
+                   'user_id': database.User,
+                   'warehouse_id': database.Warehouse}
+MOVEMENT_REFERENCES = {'warehouse_id': database.Warehouse,
+                       'to_warehouse_id': database.Warehouse}
+
+sale_writer = None
+if app.config["GROUP_COMMIT"]:
+    sale_writer = group_commit.GroupCommitWriter(app).start()
+
+hold_sweeper = None
+if app.config["HOLD_SWEEP_INTERVAL"]:
+    hold_sweeper = reservations.HoldSweeper(
+        app, app.config["HOLD_SWEEP_INTERVAL"]).start()
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db():
+    migrations.upgrade()
+    print('Database schema is up to date.')
+
+
+@app.cli.command('rebuild-monthly-sales')
+@click.option('--engine', type=click.Choice(['sql', 'numpy']),
+              default='sql')
+@click.option('--chunk-size', default=analytics.CHUNK_SIZE)
+def rebuild_monthly_sales(engine, chunk_size):
+    session = database.db.session
+    try:
+        if engine == 'numpy':
+            analytics.refresh(session, chunk_size)
+        else:
+            monthly_sales.rebuild(session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print('MonthlySales rebuilt.')
+
+
+@app.cli.command('rebuild-daily-sales')
+def rebuild_daily_sales():
+    session = database.db.session
+    try:
+        daily_sales.rebuild(session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print('DailySales rebuilt.')
+
+
+@app.cli.command('benchmark-sales-report')
+@click.option('--period', type=click.Choice(list(daily_sales.PERIODS)),
+              default='month')
+@click.option('--by', default='category')
+def benchmark_sales_report(period, by):
+    report = daily_sales.benchmark(
+        database.db.session, period, by.split(',') if by else [])
+    print(f"{report['rows']} report rows from {report['cube_rows']} cube "
+          f"rows: raw GROUP BY {report['raw_seconds']}s, "
+          f"cube {report['cube_seconds']}s, "
+          f"results {'match' if report['matches'] else 'DIFFER'}.")
+
+
+@app.cli.command('export-sales-snapshot')
+@click.option('--directory', default=lambda: app.config["SALES_SNAPSHOT_DIR"])
+@click.option('--chunk-size', default=columnar.CHUNK_SIZE)
+def export_sales_snapshot(directory, chunk_size):
+    try:
+        report = columnar.export(database.db.session, directory, chunk_size)
+    finally:
+        database.db.session.rollback()
+    print(f"Appended {report['appended']} sale items in "
+          f"{report['seconds']}s; snapshot holds {report['rows']} rows "
+          f"up to sale {report['watermark']}.")
+
+
+@app.cli.command('rebuild-customer-sketches')
+def rebuild_customer_sketches():
+    session = database.db.session
+    try:
+        report = customer_sketches.rebuild(session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f"Built {report['sketches']} customer sketches in "
+          f"{report['seconds']}s.")
+
+
+@app.cli.command('rebuild-top-sellers')
+@click.option('--days', default=2)
+def rebuild_top_sellers(days):
+    session = database.db.session
+    try:
+        replayed = top_sellers.rebuild(
+            session, datetime.utcnow() - timedelta(days=days))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f'Replayed {replayed} sales into the top-seller counters.')
+
+
+@app.cli.command('purge-top-sellers')
+@click.option('--days', default=7)
+def purge_top_sellers(days):
+    session = database.db.session
+    try:
+        purged = top_sellers.purge(
+            session, datetime.utcnow() - timedelta(days=days))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f'Purged {purged} top-seller counters.')
+
+
+@app.cli.command('benchmark-monthly-sales')
+@click.option('--chunk-size', default=analytics.CHUNK_SIZE)
+def benchmark_monthly_sales(chunk_size):
+    report = analytics.benchmark(database.db.session, chunk_size)
+    print(f"{report['months']} months: SQL GROUP BY {report['sql_seconds']}s, "
+          f"NumPy {report['numpy_seconds']}s, "
+          f"results {'match' if report['matches'] else 'DIFFER'}.")
+
+
+@app.cli.command('benchmark-engine-profiles')
+@click.option('--seconds', default=5)
+@click.option('--readers', default=4)
+@click.option('--writers', default=1)
+def benchmark_engine_profiles(seconds, readers, writers):
+    try:
+        results = benchmarks.benchmark_engine_profiles(
+            database.db.session, seconds, readers, writers)
+    finally:
+        database.db.session.rollback()
+    for name, report in results.items():
+        print(f"{name}: {report['reads_per_second']} reads/s, "
+              f"{report['writes_per_second']} writes/s, "
+              f"{report['busy']} busy errors.")
+
+
+@app.cli.command('benchmark-money')
+def benchmark_money():
+    try:
+        report = benchmarks.benchmark_money(database.db.session)
+    finally:
+        database.db.session.rollback()
+    print(f"{report['rows']} sale items over {report['months']} months: "
+          f"integer cents {report['cents_seconds']}s, "
+          f"float {report['float_seconds']}s; "
+          f"{report['inexact_months']} float totals inexact, "
+          f"worst by {report['max_drift']}.")
+
+
+@app.cli.command('benchmark-bulk-insert')
+@click.option('--lines', default=1000)
+@click.option('--rounds', default=5)
+def benchmark_bulk_insert(lines, rounds):
+    report = line_items.benchmark(database.db.session, lines, rounds)
+    print(f"{report['lines']}-line sale, mean of {report['rounds']}: "
+          f"bulk insert {report['bulk_seconds']}s, "
+          f"session.add {report['objects_seconds']}s.")
+
+
+@app.cli.command('benchmark-search')
+@click.option('--queries', default=200)
+@click.option('--category')
+def benchmark_search(queries, category):
+    report = search.benchmark(database.db.session, queries, category)
+    print(f"{report['queries']} searches over {report['products']} "
+          f"products: p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms, "
+          f"max {report['max_ms']}ms.")
+
+
+@app.cli.command('benchmark-scan')
+@click.option('--scans', default=10000)
+@click.option('--barcodes', default=1000)
+def benchmark_scan(scans, barcodes):
+    report = scan_cache.benchmark(database.db.session, scans, barcodes)
+    for name in ('cold', 'warm'):
+        print(f"{name}: p50 {report[name]['p50_ms']}ms, "
+              f"p99 {report[name]['p99_ms']}ms, "
+              f"max {report[name]['max_ms']}ms")
+    print(f"{report['scans']} scans over {report['barcodes']} barcodes, "
+          f"hit rate {report['hit_rate']:.1%}.")
+
+
+@app.cli.command('benchmark-pagination')
+@click.option('--listing', default='sales',
+              type=click.Choice(['products', 'customers', 'sales', 'orders']))
+@click.option('--page', default=10000)
+@click.option('--limit', default=pagination.DEFAULT_LIMIT)
+def benchmark_pagination(listing, page, limit):
+    model, key, descending = {
+        'products': (database.Product, database.Product.product_id, False),
+        'customers': (database.Customer, database.Customer.customer_id,
+                      False),
+        'sales': (database.Sale, database.Sale.sale_id, True),
+        'orders': (database.Order, database.Order.order_id, True),
+    }[listing]
+    report = pagination.benchmark(database.db.session, model, key,
+                                  descending, page, limit)
+    print(f"{listing}: {report['rows']} rows, {report['limit']} per page")
+    for name, label in (('first_page', 'page 1'),
+                        ('deep_page', f"page {report['page']}"),
+                        ('deep_offset', f"page {report['page']} by OFFSET")):
+        print(f"  {label}: p50 {report[name]['p50_ms']}ms, "
+              f"p99 {report[name]['p99_ms']}ms")
+
+
+@app.cli.command('benchmark-group-commit')
+@click.option('--sales', default=2000)
+@click.option('--clients', default=16)
+def benchmark_group_commit(sales, clients):
+    try:
+        report = group_commit.benchmark(
+            database.db.session, sales, clients,
+            app.config['SQLALCHEMY_ENGINE_PROFILE'])
+    finally:
+        database.db.session.rollback()
+    print(f"{report['sales']} sales from {report['clients']} clients")
+    for mode in ('direct', 'group'):
+        if mode in report:
+            print(f"  {mode}: {report[mode]['sales_per_second']} sales/s, "
+                  f"{report[mode]['sold']} sold, "
+                  f"{report[mode]['failed']} out of stock")
+    if 'group' in report:
+        print(f"  group commit used {report['group']['batches']} batches.")
+
+
+@app.cli.command('benchmark-contention')
+@click.option('--workers', default=8)
+@click.option('--updates', default=100)
+@click.option('--products', default=4)
+def benchmark_contention(workers, updates, products):
+    try:
+        report = benchmarks.benchmark_contention(
+            database.db.session, workers, updates, products,
+            profile=app.config['SQLALCHEMY_ENGINE_PROFILE'])
+    finally:
+        database.db.session.rollback()
+    print(f"{report['updates']} updates from {report['workers']} workers "
+          f"on {report['products']} products")
+    for name in ('optimistic', 'locking'):
+        if name in report:
+            print(f"  {name}: {report[name]['updates_per_second']} updates/s, "
+                  f"{report[name]['retries']} version retries, "
+                  f"{report[name]['busy']} busy errors, lock wait p99 "
+                  f"{report[name]['lock_wait']['p99_ms']}ms, "
+                  f"{report[name]['lost_updates']} lost updates")
+
+
+@app.cli.command('benchmark-allocation')
+@click.option('--orders', default=10000)
+@click.option('--warehouses', default=50)
+@click.option('--products', default=1000)
+def benchmark_allocation(orders, warehouses, products):
+    report = allocation.benchmark(
+        orders, warehouses, products,
+        profile=app.config['SQLALCHEMY_ENGINE_PROFILE'])
+    print(f"{report['orders']} orders ({report['lines']} lines) against "
+          f"{report['warehouses']} warehouses: {report['seconds']}s, "
+          f"{report['orders_per_second']} orders/s; "
+          f"{report['allocated']} lines allocated, "
+          f"{report['split_orders']} orders split.")
+
+
+@app.cli.command('snapshot-stock')
+@click.option('--warehouse-id', type=int)
+def snapshot_stock(warehouse_id):
+    session = database.db.session
+    try:
+        count = stock_ledger.take_snapshots(session, warehouse_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f'Took {count} stock snapshots.')
+
+
+@app.cli.command('reconcile-stock')
+@click.option('--fix', is_flag=True)
+@click.option('--chunk-size', default=stock_sync.CHUNK_SIZE)
+def reconcile_stock(fix, chunk_size):
+    report = stock_sync.reconcile(database.db.session, fix, chunk_size)
+    for drift in report['drifts']:
+        print(f"  product {drift['product_id']}: "
+              f"{drift['stock_quantity']} on record, "
+              f"{drift['expected']} expected")
+    print(f"Checked {report['checked']} products, "
+          f"{report['drifted']} drifted, {report['fixed']} fixed.")
+
+
+@app.cli.command('purge-idempotency-keys')
+@click.option('--ttl-hours', default=24)
+def purge_idempotency_keys(ttl_hours):
+    purged = idempotency.purge_expired(
+        database.db.session, timedelta(hours=ttl_hours))
+    print(f'Purged {purged} expired idempotency keys.')
+
+
+@app.cli.command('allocate-orders')
+@click.option('--limit', default=allocation.DEFAULT_BATCH)
+@click.option('--hold-minutes', default=30)
+def allocate_orders(limit, hold_minutes):
+    session = database.db.session
+    try:
+        report = allocation.allocate(
+            session, limit, timedelta(minutes=hold_minutes))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f"Allocated {report['allocated']} of {report['lines']} lines "
+          f"across {report['orders']} orders in {report['seconds']}s "
+          f"({report['split_orders']} split).")
+
+
+@app.cli.command('expire-holds')
+def expire_holds():
+    session = database.db.session
+    try:
+        expired = reservations.expire_holds(session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f'Expired {expired} stock holds.')
+
+
+@app.cli.command('suggest-reorders')
+@click.option('--incremental', is_flag=True)
+@click.option('--lookback-days', default=replenishment.LOOKBACK_DAYS)
+@click.option('--lead-time-days', default=replenishment.LEAD_TIME_DAYS)
+@click.option('--review-days', default=replenishment.REVIEW_DAYS)
+def suggest_reorders(incremental, lookback_days, lead_time_days,
+                     review_days):
+    session = database.db.session
+    try:
+        report = replenishment.suggest(session, incremental, lookback_days,
+                                       lead_time_days, review_days)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    print(f"Computed reorder points for {report['products']} products and "
+          f"{report['warehouse_items']} warehouse items in "
+          f"{report['seconds']}s; {report['to_order']} need ordering.")
+
+
+@app.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=catalog_import.CHUNK_SIZE)
+def import_catalog(path, chunk_size):
+    with open(path, newline='', encoding='utf-8') as stream:
+        report = catalog_import.import_catalog(stream, chunk_size)
+    print(f"Imported {report['imported']} products "
+          f"({report['rows_per_second']} rows/s), "
+          f"rejected {report['rejected']} lines.")
+    for rejection in report['rejections']:
+        print(f"  line {rejection['line']}: {rejection['error']}")
+
+
+def query_arg(name, type):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return type(value)
+    except ValueError:
+        abort(400)
 
 
 @app.route('/')
@@ -11,5 +422,480 @@ def index():
     return render_template("index.html")
 
 
+def list_view(model, key, descending=False, filters=()):
+    fields = request.args.get('fields')
+    limit = query_arg('limit', int) or pagination.DEFAULT_LIMIT
+    try:
+        page = pagination.keyset_page(
+            database.db.session, model, key, request.args.get('cursor'),
+            max(1, min(limit, pagination.MAX_LIMIT)), descending,
+            fields.split(',') if fields else None, filters)
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    return jsonify(page)
+
+
+@app.route('/api/products')
+def list_products():
+    filters = []
+    if 'category' in request.args:
+        filters.append(database.Product.category == request.args['category'])
+    return list_view(database.Product, database.Product.product_id,
+                     filters=filters)
+
+
+@app.route('/api/customers')
+def list_customers():
+    return list_view(database.Customer, database.Customer.customer_id)
+
+
+@app.route('/api/sales')
+def list_sales():
+    filters = []
+    customer_id = query_arg('customer_id', int)
+    if customer_id is not None:
+        filters.append(database.Sale.customer_id == customer_id)
+    return list_view(database.Sale, database.Sale.sale_id, descending=True,
+                     filters=filters)
+
+
+@app.route('/api/orders')
+def list_orders():
+    filters = []
+    customer_id = query_arg('customer_id', int)
+    if customer_id is not None:
+        filters.append(database.Order.customer_id == customer_id)
+    return list_view(database.Order, database.Order.order_id,
+                     descending=True, filters=filters)
+
+
+def serialize_row(instance):
+    return {column.key: pagination.serialize(getattr(instance, column.key))
+            for column in instance.__table__.columns}
+
+
+def versioned(instance):
+    response = jsonify(serialize_row(instance))
+    response.set_etag(str(instance.version))
+    return response
+
+
+def check_if_match(instance):
+    if request.if_match and not request.if_match.contains(
+            str(instance.version)):
+        abort(412)
+
+
+def commit_versioned():
+    session = database.db.session
+    try:
+        session.commit()
+    except StaleDataError:
+        session.rollback()
+        abort(412)
+    except IntegrityError:
+        session.rollback()
+        abort(409)
+
+
+@app.route('/api/reports/sales')
+def sales_report():
+    by = request.args.get('by')
+    try:
+        rows = daily_sales.report(
+            database.db.session, request.args.get('period', 'month'),
+            by.split(',') if by else [], request.args.get('start'),
+            request.args.get('end'))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    return jsonify(rows=[
+        {name: pagination.serialize(value) for name, value in row.items()}
+        for row in rows])
+
+
+@app.route('/api/reports/top-sellers')
+def top_sellers_report():
+    scope, scope_key = 'all', ''
+    warehouse_id = query_arg('warehouse_id', int)
+    if warehouse_id is not None:
+        scope, scope_key = 'warehouse', str(warehouse_id)
+    elif request.args.get('category') is not None:
+        scope, scope_key = 'category', request.args['category']
+    limit = query_arg('limit', int) or 20
+    try:
+        report = top_sellers.top(
+            database.db.session, request.args.get('period', 'hour'),
+            request.args.get('start'), scope, scope_key,
+            max(1, min(limit, top_sellers.CAPACITY)))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    return jsonify(report)
+
+
+@app.route('/api/reports/customers')
+def distinct_customers_report():
+    scope, scope_key = 'all', ''
+    product_id = query_arg('product_id', int)
+    if product_id is not None:
+        scope, scope_key = 'product', str(product_id)
+    elif request.args.get('category') is not None:
+        scope, scope_key = 'category', request.args['category']
+    return jsonify(customer_sketches.distinct_customers(
+        database.db.session, scope, scope_key, request.args.get('start'),
+        request.args.get('end')))
+
+
+@app.route('/api/products/<int:product_id>')
+def get_product(product_id):
+    return versioned(database.db.get_or_404(database.Product, product_id))
+
+
+@app.route('/api/products/<int:product_id>', methods=['PATCH'])
+def update_product(product_id):
+    session = database.db.session
+    product = database.db.get_or_404(database.Product, product_id)
+    check_if_match(product)
+    payload = request.get_json(silent=True) or {}
+    changes = {}
+    for name, value in payload.items():
+        if name not in PRODUCT_FIELDS:
+            return jsonify(error=f'unknown field {name}'), 400
+        if name in NULLABLE_PRODUCT_FIELDS and (
+                value is None or not str(value).strip()):
+            changes[name] = None
+            continue
+        try:
+            changes[name] = PRODUCT_FIELDS[name](value, name)
+        except ValueError as error:
+            return jsonify(error=str(error)), 400
+    previous_stock = product.stock_quantity
+    for name, value in changes.items():
+        setattr(product, name, value)
+    if product.stock_quantity != previous_stock:
+        stock_ledger.log_movement(
+            session, product_id, product.stock_quantity - previous_stock,
+            'adjustment', notes='product update')
+    commit_versioned()
+    return versioned(product)
+
+
+def get_warehouse_item(warehouse_id, product_id):
+    return database.db.first_or_404(database.db.select(
+        database.WarehouseItem).where(
+            database.WarehouseItem.warehouse_id == warehouse_id,
+            database.WarehouseItem.product_id == product_id))
+
+
+@app.route('/api/warehouses/<int:warehouse_id>/items/<int:product_id>')
+def warehouse_item(warehouse_id, product_id):
+    return versioned(get_warehouse_item(warehouse_id, product_id))
+
+
+@app.route('/api/warehouses/<int:warehouse_id>/items/<int:product_id>',
+           methods=['PATCH'])
+def update_warehouse_item(warehouse_id, product_id):
+    item = get_warehouse_item(warehouse_id, product_id)
+    check_if_match(item)
+    payload = request.get_json(silent=True) or {}
+    try:
+        quantity = int(payload['quantity'])
+    except (KeyError, TypeError, ValueError) as error:
+        return jsonify(error=f'invalid field {error}'), 400
+    if quantity < 0:
+        return jsonify(error='quantity must not be negative'), 400
+    if quantity < item.reserved_quantity:
+        return jsonify(error='quantity is below reserved stock'), 409
+    if quantity != item.quantity:
+        stock_ledger.log_movement(
+            database.db.session, product_id, quantity - item.quantity,
+            'adjustment', warehouse_id, 'warehouse item update')
+        item.quantity = quantity
+    commit_versioned()
+    scan_cache.scan_cache.discard_products([product_id])
+    return versioned(item)
+
+
+@app.route('/products/import', methods=['POST'])
+def upload_catalog():
+    upload = request.files.get('file')
+    if upload is None:
+        abort(400)
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    return jsonify(catalog_import.import_catalog(stream))
+
+
+@app.route('/products/search')
+def search_products():
+    query = request.args.get('q', '')
+    limit = min(query_arg('limit', int) or 20, 100)
+    results = search.search_products(
+        database.db.session, query, request.args.get('category'), limit)
+    return jsonify([dict(result, price=str(result['price']))
+                    for result in results])
+
+
+@app.route('/scan/<barcode>')
+def scan(barcode):
+    entry = scan_cache.lookup(database.db.session, barcode)
+    if entry is None:
+        abort(404)
+    return jsonify(dict(entry, price=str(entry['price'])))
+
+
+@app.route('/scan/stats')
+def scan_stats():
+    return jsonify(scan_cache.scan_cache.stats())
+
+
+@app.route('/api/stock/<int:product_id>')
+def stock_level(product_id):
+    session = database.db.session
+    warehouse_id = query_arg('warehouse_id', int)
+    as_of = query_arg('as_of', datetime.fromisoformat)
+    if as_of is None and warehouse_id is None:
+        quantity = session.execute(
+            database.db.select(database.Product.stock_quantity)
+            .where(database.Product.product_id == product_id)).scalar()
+    elif as_of is None:
+        quantity = session.execute(
+            database.db.select(database.WarehouseItem.quantity)
+            .where(database.WarehouseItem.product_id == product_id,
+                   database.WarehouseItem.warehouse_id == warehouse_id)
+        ).scalar()
+    elif warehouse_id is None:
+        quantity = stock_ledger.product_stock_as_of(
+            session, product_id, as_of)
+    else:
+        quantity = stock_ledger.stock_as_of(
+            session, product_id, warehouse_id, as_of)
+    if quantity is None:
+        abort(404)
+    return jsonify(product_id=product_id, warehouse_id=warehouse_id,
+                   as_of=as_of.isoformat() if as_of else None,
+                   quantity=quantity)
+
+
+@app.route('/api/stock/movements', methods=['POST'])
+def record_stock_movement():
+    session = database.db.session
+    payload = request.get_json(silent=True) or {}
+    try:
+        product_id = int(payload['product_id'])
+        quantity = int(payload['quantity'])
+        movement_type = payload['movement_type']
+        warehouses = {name: int(payload[name])
+                      for name in MOVEMENT_REFERENCES
+                      if payload.get(name) is not None}
+        if movement_type not in ('receipt', 'adjustment', 'transfer'):
+            raise ValueError(f'unsupported movement type {movement_type!r}')
+        if movement_type == 'transfer' and len(warehouses) < 2:
+            raise ValueError('transfer needs warehouse_id and '
+                             'to_warehouse_id')
+    except (KeyError, TypeError, ValueError) as error:
+        return jsonify(error=str(error)), 400
+    if session.get(database.Product, product_id) is None:
+        session.rollback()
+        return jsonify(error=f'unknown product {product_id}'), 404
+    unknown = unknown_references(session, warehouses, MOVEMENT_REFERENCES)
+    if unknown:
+        session.rollback()
+        return jsonify(error=f'unknown {", ".join(unknown)}'), 400
+    warehouse_id = warehouses.get('warehouse_id')
+    try:
+        if movement_type == 'transfer':
+            stock_ledger.transfer(
+                session, product_id, warehouse_id,
+                warehouses['to_warehouse_id'], quantity, payload.get('notes'))
+        else:
+            stock_ledger.record_movement(
+                session, product_id, quantity, movement_type, warehouse_id,
+                payload.get('notes'))
+        session.commit()
+    except stock_ledger.InsufficientStock:
+        session.rollback()
+        return jsonify(error='insufficient stock'), 409
+    except IntegrityError as error:
+        session.rollback()
+        return jsonify(error=str(error.orig)), 400
+    except ValueError as error:
+        session.rollback()
+        return jsonify(error=str(error)), 400
+    except Exception:
+        session.rollback()
+        raise
+    scan_cache.scan_cache.discard_products([product_id])
+    return jsonify(product_id=product_id), 201
+
+
+def replay(stored, fingerprint):
+    if stored.request_hash != fingerprint:
+        return jsonify(error='Idempotency-Key reused with a different '
+                       'request'), 422
+    response = app.response_class(stored.response_body, stored.status_code,
+                                  mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def stored_response(session, endpoint, key):
+    # An IntegrityError is only a lost idempotency race when the winner's
+    # response is there to replay; anything else is a bad reference.
+    if key is None:
+        return None
+    stored = idempotency.find_response(session, endpoint, key)
+    session.rollback()
+    return stored
+
+
+def parse_lines(payload):
+    return [(int(line['product_id']), int(line['quantity']))
+            for line in payload['lines']]
+
+
+def unknown_references(session, values, references):
+    return [name for name, model in references.items()
+            if values.get(name) is not None
+            and session.get(model, values[name]) is None]
+
+
+@app.route('/api/sales', methods=['POST'])
+def create_sale():
+    session = database.db.session
+    payload = request.get_json(silent=True) or {}
+    try:
+        lines = parse_lines(payload)
+        values = {name: payload.get(name) for name in SALE_FIELDS}
+    except (KeyError, TypeError, ValueError) as error:
+        return jsonify(error=str(error)), 400
+    if not lines or any(quantity <= 0 for _, quantity in lines):
+        return jsonify(error='sale needs lines with positive quantities'), 400
+    unknown = unknown_references(session, values, SALE_REFERENCES)
+    session.rollback()
+    if unknown:
+        return jsonify(error=f'unknown {", ".join(unknown)}'), 400
+    key = request.headers.get('Idempotency-Key')
+    fingerprint = idempotency.request_hash(payload)
+    if key is not None:
+        stored = idempotency.find_response(session, 'sales', key)
+        session.rollback()
+        if stored is not None:
+            return replay(stored, fingerprint)
+
+        def remember(session, sale_id):
+            idempotency.store_response(session, 'sales', key, fingerprint,
+                                       201, {'sale_id': sale_id})
+        values['on_recorded'] = remember
+    try:
+        if sale_writer is not None:
+            sale_id, failed = sale_writer.submit(lines, **values).result()
+        else:
+            sale_id, failed = checkout.checkout(lines, **values)
+    except IntegrityError as error:
+        stored = stored_response(session, 'sales', key)
+        if stored is None:
+            return jsonify(error=str(error.orig)), 400
+        return replay(stored, fingerprint)
+    if sale_id is None:
+        return jsonify(failed=[
+            {'product_id': product_id, 'quantity': quantity}
+            for product_id, quantity in failed]), 409
+    return jsonify(sale_id=sale_id), 201
+
+
+@app.route('/api/orders', methods=['POST'])
+def create_order():
+    session = database.db.session
+    payload = request.get_json(silent=True) or {}
+    try:
+        lines = parse_lines(payload)
+        values = {name: payload.get(name) for name in ORDER_FIELDS}
+    except (KeyError, TypeError, ValueError) as error:
+        return jsonify(error=str(error)), 400
+    if not lines or any(quantity <= 0 for _, quantity in lines):
+        return jsonify(error='order needs lines with positive quantities'), 400
+    key = request.headers.get('Idempotency-Key')
+    fingerprint = idempotency.request_hash(payload)
+    if key is not None:
+        stored = idempotency.find_response(session, 'orders', key)
+        if stored is not None:
+            session.rollback()
+            return replay(stored, fingerprint)
+    prices = dict(session.execute(
+        database.db.select(database.Product.product_id,
+                           database.Product.price)
+        .where(database.Product.product_id.in_(
+            {product_id for product_id, _ in lines}))).all())
+    session.rollback()
+    unknown = sorted({product_id for product_id, _ in lines} - set(prices))
+    if unknown:
+        return jsonify(error=f'unknown products {unknown}'), 400
+    try:
+        order_id = line_items.insert_order(
+            session, [(product_id, quantity, prices[product_id])
+                      for product_id, quantity in lines], **values)
+        if key is not None:
+            idempotency.store_response(session, 'orders', key, fingerprint,
+                                       201, {'order_id': order_id})
+        session.commit()
+    except IntegrityError as error:
+        session.rollback()
+        stored = stored_response(session, 'orders', key)
+        if stored is None:
+            return jsonify(error=str(error.orig)), 400
+        return replay(stored, fingerprint)
+    except Exception:
+        session.rollback()
+        raise
+    return jsonify(order_id=order_id), 201
+
+
+@app.route('/api/orders/<int:order_id>/fulfil', methods=['POST'])
+def fulfil_order(order_id):
+    session = database.db.session
+    try:
+        delivery_id, product_ids = reservations.fulfil_order(
+            session, order_id)
+        session.commit()
+    except reservations.ReservationError as error:
+        session.rollback()
+        return jsonify(error=str(error)), 409
+    except Exception:
+        session.rollback()
+        raise
+    scan_cache.scan_cache.discard_products(product_ids)
+    return jsonify(delivery_id=delivery_id), 201
+
+
+@app.route('/api/orders/<int:order_id>/release', methods=['POST'])
+def release_order(order_id):
+    session = database.db.session
+    try:
+        released = reservations.release_order(session, order_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return jsonify(released=released)
+
+
+@app.route('/sales/export')
+def export_sales():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        abort(400)
+    filters = {
+        'start': query_arg('start', datetime.fromisoformat),
+        'end': query_arg('end', datetime.fromisoformat),
+        'customer_id': query_arg('customer_id', int),
+        'payment_method': request.args.get('payment_method'),
+    }
+    if export_format == 'csv':
+        rows, mimetype = export.iter_csv(**filters), 'text/csv'
+    else:
+        rows, mimetype = export.iter_ndjson(**filters), 'application/x-ndjson'
+    return Response(stream_with_context(rows), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=sales.{export_format}'})
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=3300)
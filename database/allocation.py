@@ -0,0 +1,181 @@
+import os
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import insert, text, update
+from database import migrations
+from database.benchmarks import dispose, scratch_app
+from database.database import (db, Order, OrderItem, Product, Warehouse,
+                               WarehouseItem)
+from database.reservations import DEFAULT_TTL, expire_holds, hold_lines
+
+DEFAULT_BATCH = 10000
+
+OPEN_LINES_SQL = '''
+    SELECT order_item.order_item_id, order_item.order_id,
+           order_item.product_id, order_item.quantity
+    FROM order_item
+    WHERE order_item.warehouse_id IS NULL
+    AND order_item.product_id IS NOT NULL
+    AND order_item.order_id IN (
+        SELECT "order".order_id FROM "order"
+        WHERE NOT EXISTS (SELECT 1 FROM delivery
+                          WHERE delivery.order_id = "order".order_id)
+        AND EXISTS (SELECT 1 FROM order_item AS open_item
+                    WHERE open_item.order_id = "order".order_id
+                    AND open_item.warehouse_id IS NULL)
+        ORDER BY "order".order_date, "order".order_id
+        LIMIT :limit)
+    ORDER BY order_item.order_id, order_item.order_item_id
+'''
+
+AVAILABILITY_SQL = '''
+    SELECT product_id, warehouse_id, quantity - reserved_quantity,
+           warehouse_item_id
+    FROM warehouse_item
+    WHERE product_id IN (
+        SELECT value FROM json_each(:product_ids))
+'''
+
+
+def load_open_lines(session, limit):
+    rows = session.execute(text(OPEN_LINES_SQL), {'limit': limit}).all()
+    if not rows:
+        return np.empty((0, 4), dtype=np.int64)
+    return np.array(list(map(tuple, rows)), dtype=np.int64)
+
+
+def load_availability(session, product_ids):
+    rows = session.execute(text(AVAILABILITY_SQL), {
+        'product_ids': '[' + ','.join(map(str, product_ids)) + ']'}).all()
+    data = np.array(list(map(tuple, rows)), dtype=np.int64).reshape(-1, 4)
+    warehouse_ids = np.unique(data[:, 1])
+    shape = (len(product_ids), len(warehouse_ids))
+    availability = np.zeros(shape, dtype=np.int64)
+    warehouse_items = np.zeros(shape, dtype=np.int64)
+    rows = np.searchsorted(product_ids, data[:, 0])
+    columns = np.searchsorted(warehouse_ids, data[:, 1])
+    availability[rows, columns] = np.maximum(data[:, 2], 0)
+    warehouse_items[rows, columns] = data[:, 3]
+    return warehouse_ids, availability, warehouse_items
+
+
+def allocate_order(availability, products, quantities):
+    assigned = np.full(len(products), -1, dtype=np.int64)
+    unique, inverse = np.unique(products, return_inverse=True)
+    demand = np.bincount(inverse, weights=quantities).astype(np.int64)
+    stock = availability[unique]
+    whole = (stock >= demand[:, None]).all(axis=0)
+    if whole.any():
+        warehouse = np.flatnonzero(whole)[
+            np.argmax(stock.sum(axis=0)[whole])]
+        assigned[:] = warehouse
+        availability[unique, warehouse] -= demand
+        return assigned
+    remaining = np.ones(len(products), dtype=bool)
+    while remaining.any():
+        fits = availability[products] >= quantities[:, None]
+        coverage = (fits & remaining[:, None]).sum(axis=0)
+        warehouse = np.argmax(coverage)
+        if coverage[warehouse] == 0:
+            break
+        for line in np.flatnonzero(remaining & fits[:, warehouse]):
+            if availability[products[line], warehouse] >= quantities[line]:
+                availability[products[line], warehouse] -= quantities[line]
+                assigned[line] = warehouse
+                remaining[line] = False
+    return assigned
+
+
+def allocate(session, limit=DEFAULT_BATCH, ttl=DEFAULT_TTL):
+    started = time.perf_counter()
+    expire_holds(session)
+    lines = load_open_lines(session, limit)
+    report = {'orders': 0, 'lines': len(lines), 'allocated': 0,
+              'split_orders': 0, 'seconds': 0.0}
+    if not len(lines):
+        return report
+    product_ids, product_index = np.unique(lines[:, 2], return_inverse=True)
+    warehouse_ids, availability, warehouse_items = load_availability(
+        session, product_ids)
+    if not len(warehouse_ids):
+        return report
+    assigned = np.full(len(lines), -1, dtype=np.int64)
+    boundaries = np.flatnonzero(np.diff(lines[:, 1])) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(lines)]))
+    for start, end in zip(starts, ends):
+        assigned[start:end] = allocate_order(
+            availability, product_index[start:end], lines[start:end, 3])
+        chosen = assigned[start:end]
+        if len(np.unique(chosen[chosen >= 0])) > 1:
+            report['split_orders'] += 1
+    done = assigned >= 0
+    if done.any():
+        session.execute(update(OrderItem), [
+            {'order_item_id': int(order_item_id),
+             'warehouse_id': int(warehouse_id)}
+            for order_item_id, warehouse_id in zip(
+                lines[done, 0], warehouse_ids[assigned[done]])])
+        hold_lines(session, [
+            (int(order_item_id), int(warehouse_item_id), int(quantity))
+            for order_item_id, warehouse_item_id, quantity in zip(
+                lines[done, 0],
+                warehouse_items[product_index[done], assigned[done]],
+                lines[done, 3])], ttl)
+    report.update(orders=len(starts), allocated=int(done.sum()),
+                  seconds=round(time.perf_counter() - started, 3))
+    return report
+
+
+def seed_workload(session, rng, orders, warehouses, products, lines):
+    session.execute(insert(Product), [
+        {'product_id': product_id, 'product_name': f'product {product_id}',
+         'price': 1, 'stock_quantity': 0}
+        for product_id in range(1, products + 1)])
+    session.execute(insert(Warehouse), [
+        {'warehouse_id': warehouse_id,
+         'warehouse_name': f'warehouse {warehouse_id}'}
+        for warehouse_id in range(1, warehouses + 1)])
+    # Each warehouse stocks about a third of the catalog.
+    stocked = np.argwhere(rng.random((warehouses, products)) < 1 / 3) + 1
+    session.execute(insert(WarehouseItem), [
+        {'warehouse_id': int(warehouse_id), 'product_id': int(product_id),
+         'quantity': int(quantity)}
+        for (warehouse_id, product_id), quantity in zip(
+            stocked, rng.integers(0, 50, len(stocked)))])
+    counts = rng.integers(1, 2 * lines, orders)
+    session.execute(insert(Order), [
+        {'order_id': order_id, 'quantity': int(count), 'total_amount': 0}
+        for order_id, count in enumerate(counts, 1)])
+    session.execute(insert(OrderItem), [
+        {'order_id': int(order_id), 'product_id': int(product_id),
+         'quantity': int(quantity), 'unit_price': 1,
+         'item_amount': int(quantity)}
+        for order_id, product_id, quantity in zip(
+            np.repeat(np.arange(1, orders + 1), counts),
+            rng.integers(1, products + 1, counts.sum()),
+            rng.integers(1, 5, counts.sum()))])
+    session.commit()
+
+
+def benchmark(orders=10000, warehouses=50, products=1000, lines=3,
+              profile='tuned', seed=0):
+    # The backlog is synthetic, so the scratch database starts empty rather
+    # than as a copy.
+    with tempfile.TemporaryDirectory() as directory:
+        app = scratch_app(os.path.join(directory, 'allocation.db'), profile)
+        with app.app_context():
+            migrations.upgrade()
+            session = db.session
+            seed_workload(session, np.random.default_rng(seed), orders,
+                          warehouses, products, lines)
+            report = allocate(session, limit=orders)
+            session.commit()
+            session.remove()
+        dispose(app)
+    report['warehouses'] = warehouses
+    report['orders_per_second'] = (round(report['orders'] /
+                                         report['seconds'])
+                                   if report['seconds'] else 0)
+    return report
@@ -0,0 +1,211 @@
+import time
+import numpy as np
+from sqlalchemy import text
+from database.monthly_sales import rebuild
+
+CHUNK_SIZE = 100000
+
+MONTH_INDEX = '''(CAST(strftime('%Y', sale.sale_date) AS INTEGER) * 12
+                  + CAST(strftime('%m', sale.sale_date) AS INTEGER) - 1)'''
+
+SALES_SQL = f'''
+    SELECT sale.sale_id, {MONTH_INDEX}, COALESCE(sale.customer_id, -1)
+    FROM sale
+    WHERE sale.sale_id > ? AND sale.sale_date IS NOT NULL
+    ORDER BY sale.sale_id
+    LIMIT ?
+'''
+
+SALE_ITEMS_SQL = '''
+    SELECT sale_id, COALESCE(product_id, -1), item_amount,
+           unit_cost * quantity
+    FROM sale_item
+    WHERE sale_id > ? AND sale_id <= ?
+'''
+
+KPI_COLUMNS = (
+    'sales', 'profit', 'revenue', 'profit_margin', 'revenue_growth',
+    'profit_growth', 'revenue_per_sale', 'profit_per_sale',
+    'revenue_per_customer', 'profit_per_customer', 'revenue_per_product',
+    'profit_per_product', 'customers', 'products')
+
+# Distinct (month, id) pairs are packed into one int64 so that a plain 1-D
+# sort deduplicates them.
+PAIR_SHIFT = 32
+
+
+def fetch_array(cursor, sql, params, columns):
+    rows = cursor.execute(sql, params).fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, columns)
+
+
+def read_chunks(session, chunk_size=CHUNK_SIZE):
+    cursor = session.connection().connection.cursor()
+    after = 0
+    try:
+        while True:
+            sales = fetch_array(cursor, SALES_SQL, (after, chunk_size), 3)
+            if not len(sales):
+                return
+            last = int(sales[-1, 0])
+            items = fetch_array(cursor, SALE_ITEMS_SQL, (after, last), 4)
+            position = np.searchsorted(sales[:, 0], items[:, 0])
+            position = np.minimum(position, len(sales) - 1)
+            dated = sales[position, 0] == items[:, 0]
+            items = items[dated]
+            items[:, 0] = sales[position[dated], 1]
+            yield sales, items
+            after = last
+    finally:
+        cursor.close()
+
+
+def group_sum(keys, *values):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, [np.rint(np.bincount(inverse, weights=value,
+                                        minlength=len(unique)))
+                    .astype(np.int64) for value in values]
+
+
+def pack_pairs(months, ids):
+    known = ids >= 0
+    return np.unique((months[known] << PAIR_SHIFT) | ids[known])
+
+
+def unpack_pairs(chunks):
+    pairs = np.unique(np.concatenate(chunks or [np.empty(0, np.int64)]))
+    return np.column_stack([pairs >> PAIR_SHIFT,
+                            pairs & ((1 << PAIR_SHIFT) - 1)])
+
+
+def align(months, keys, values):
+    result = np.zeros(len(months), dtype=np.int64)
+    result[np.searchsorted(months, keys)] = values
+    return result
+
+
+def ratio(numerator, denominator):
+    result = np.zeros(len(numerator))
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+
+def growth(months, values, scale):
+    position = np.clip(np.searchsorted(months, months - 1),
+                       0, max(len(months) - 1, 0))
+    previous = np.where(months[position] == months - 1, values[position], 0)
+    return ratio((values - previous).astype(float), scale(previous))
+
+
+def month_label(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def compute(session, chunk_size=CHUNK_SIZE):
+    sale_parts, item_parts, customer_parts, product_parts = [], [], [], []
+    for sales, items in read_chunks(session, chunk_size):
+        months, (counts,) = group_sum(sales[:, 1], np.ones(len(sales)))
+        sale_parts.append(np.column_stack([months, counts]))
+        months, (revenue, cost) = group_sum(
+            items[:, 0], items[:, 2], items[:, 3])
+        item_parts.append(np.column_stack([months, revenue, cost]))
+        customer_parts.append(pack_pairs(sales[:, 1], sales[:, 2]))
+        product_parts.append(pack_pairs(items[:, 0], items[:, 1]))
+    sales = np.concatenate(sale_parts or [np.empty((0, 2), np.int64)])
+    items = np.concatenate(item_parts or [np.empty((0, 3), np.int64)])
+    customers = unpack_pairs(customer_parts)
+    products = unpack_pairs(product_parts)
+
+    months, (counts,) = group_sum(sales[:, 0], sales[:, 1])
+    item_months, (revenue, cost) = group_sum(
+        items[:, 0], items[:, 1], items[:, 2])
+    revenue = align(months, item_months, revenue)
+    profit = revenue - align(months, item_months, cost)
+    customer_months, customer_counts = np.unique(
+        customers[:, 0], return_counts=True)
+    product_months, product_counts = np.unique(
+        products[:, 0], return_counts=True)
+    distinct_customers = align(months, customer_months, customer_counts)
+    distinct_products = align(months, product_months, product_counts)
+    kpis = {
+        'month': months,
+        'sales': counts,
+        'profit': profit,
+        'revenue': revenue,
+        'profit_margin': ratio(profit.astype(float), revenue),
+        'revenue_growth': growth(months, revenue, lambda x: x),
+        'profit_growth': growth(months, profit, np.abs),
+        'revenue_per_sale': ratio(revenue / 100.0, counts),
+        'profit_per_sale': ratio(profit / 100.0, counts),
+        'revenue_per_customer': ratio(revenue / 100.0, distinct_customers),
+        'profit_per_customer': ratio(profit / 100.0, distinct_customers),
+        'revenue_per_product': ratio(revenue / 100.0, distinct_products),
+        'profit_per_product': ratio(profit / 100.0, distinct_products),
+        'customers': distinct_customers,
+        'products': distinct_products,
+    }
+    return kpis, customers, products
+
+
+def refresh(session, chunk_size=CHUNK_SIZE):
+    started = time.perf_counter()
+    kpis, customers, products = compute(session, chunk_size)
+    labels = {month: month_label(month)
+              for month in kpis['month'].tolist()}
+    connection = session.connection()
+    connection.exec_driver_sql('DELETE FROM monthly_sales_customer')
+    connection.exec_driver_sql('DELETE FROM monthly_sales_product')
+    connection.exec_driver_sql('DELETE FROM monthly_sales')
+    if len(customers):
+        connection.exec_driver_sql(
+            'INSERT INTO monthly_sales_customer (month, customer_id) '
+            'VALUES (?, ?)',
+            [(labels[month], customer_id)
+             for month, customer_id in customers.tolist()])
+    if len(products):
+        connection.exec_driver_sql(
+            'INSERT INTO monthly_sales_product (month, product_id) '
+            'VALUES (?, ?)',
+            [(labels[month], product_id)
+             for month, product_id in products.tolist()])
+    rows = list(zip(map(labels.get, kpis['month'].tolist()),
+                    *(kpis[name].tolist() for name in KPI_COLUMNS)))
+    if rows:
+        connection.exec_driver_sql(
+            f"INSERT INTO monthly_sales (month, {', '.join(KPI_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * (len(KPI_COLUMNS) + 1))})", rows)
+    return {'months': len(rows),
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+def snapshot(session):
+    return session.execute(text(f'''
+        SELECT month, {', '.join(KPI_COLUMNS)} FROM monthly_sales
+        ORDER BY month
+    ''')).all()
+
+
+def same_rows(expected, actual):
+    if len(expected) != len(actual):
+        return False
+    for left, right in zip(expected, actual):
+        if left[0] != right[0] or not np.allclose(
+                np.array(left[1:], dtype=float),
+                np.array(right[1:], dtype=float)):
+            return False
+    return True
+
+
+def benchmark(session, chunk_size=CHUNK_SIZE):
+    started = time.perf_counter()
+    rebuild(session)
+    sql_seconds = time.perf_counter() - started
+    expected = snapshot(session)
+    session.rollback()
+    report = refresh(session, chunk_size)
+    actual = snapshot(session)
+    session.rollback()
+    return {'months': report['months'],
+            'sql_seconds': round(sql_seconds, 3),
+            'numpy_seconds': report['seconds'],
+            'matches': same_rows(expected, actual)}
@@ -0,0 +1,243 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from decimal import Decimal
+import numpy as np
+from flask import Flask
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+from database.database import (ENGINE_PROFILES, Product, apply_pragmas, db,
+                               install_engine_profile)
+
+# A copy of a WAL database stays in WAL mode, so the profile without
+# pragmas is measured with SQLite's rollback journal switched back on.
+BASELINE_PRAGMAS = {'journal_mode': 'DELETE'}
+
+READ_SQL = '''
+    SELECT product_name, price, stock_quantity FROM product
+    WHERE product_id = ?
+'''
+
+WRITE_SQL = '''
+    UPDATE product SET stock_quantity = stock_quantity - 1,
+        version = version + 1
+    WHERE product_id = ?
+'''
+
+
+# Benchmarks that write run against a copy made here, opened through
+# scratch_app(), so the live database is never modified.
+def copy_database(session, path):
+    target = sqlite3.connect(path)
+    try:
+        session.connection().connection.driver_connection.backup(target)
+    finally:
+        target.close()
+
+
+def scratch_app(path, profile):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_ENGINE_PROFILE'] = profile
+    db.init_app(app)
+    install_engine_profile(app)
+    return app
+
+
+def dispose(app):
+    with app.app_context():
+        db.engine.dispose()
+
+
+def mixed_workload(path, pragmas, seconds, readers, writers):
+    connection = sqlite3.connect(path)
+    apply_pragmas(connection, pragmas)
+    products = connection.execute(
+        'SELECT MAX(product_id) FROM product').fetchone()[0] or 1
+    connection.close()
+    counts = {'reads': 0, 'writes': 0, 'busy': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run(write):
+        connection = sqlite3.connect(path)
+        apply_pragmas(connection, pragmas)
+        done = busy = 0
+        try:
+            while time.monotonic() < deadline:
+                product_id = random.randint(1, products)
+                try:
+                    if write:
+                        connection.execute(WRITE_SQL, (product_id,))
+                        connection.commit()
+                    else:
+                        connection.execute(READ_SQL, (product_id,)).fetchone()
+                    done += 1
+                except sqlite3.OperationalError:
+                    connection.rollback()
+                    busy += 1
+        finally:
+            connection.close()
+        with lock:
+            counts['writes' if write else 'reads'] += done
+            counts['busy'] += busy
+
+    threads = [threading.Thread(target=run, args=(write,))
+               for write in [False] * readers + [True] * writers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'reads_per_second': round(counts['reads'] / seconds),
+            'writes_per_second': round(counts['writes'] / seconds),
+            'busy': counts['busy']}
+
+
+def benchmark_engine_profiles(session, seconds=5, readers=4, writers=1):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, pragmas in ENGINE_PROFILES.items():
+            path = os.path.join(directory, f'{name}.db')
+            copy_database(session, path)
+            results[name] = mixed_workload(
+                path, pragmas or BASELINE_PRAGMAS, seconds, readers, writers)
+    return results
+
+
+MONEY_TABLE_SQL = '''
+    CREATE TEMP TABLE money_benchmark AS
+    SELECT strftime('%Y-%m', sale.sale_date) AS month,
+           sale_item.item_amount AS cents,
+           sale_item.item_amount / 100.0 AS amount
+    FROM sale JOIN sale_item ON sale_item.sale_id = sale.sale_id
+    WHERE sale.sale_date IS NOT NULL
+'''
+
+
+def timed_rows(session, sql):
+    started = time.perf_counter()
+    rows = session.execute(text(sql)).all()
+    return rows, time.perf_counter() - started
+
+
+def benchmark_money(session):
+    # The float column holds what the pre-cents schema stored, so both
+    # aggregations read the same rows from the same table.
+    session.execute(text(MONEY_TABLE_SQL))
+    try:
+        cents, cents_seconds = timed_rows(session, '''
+            SELECT month, SUM(cents) FROM money_benchmark
+            GROUP BY month ORDER BY month''')
+        floats, float_seconds = timed_rows(session, '''
+            SELECT month, SUM(amount) FROM money_benchmark
+            GROUP BY month ORDER BY month''')
+        rows = session.execute(
+            text('SELECT COUNT(*) FROM money_benchmark')).scalar()
+    finally:
+        session.execute(text('DROP TABLE money_benchmark'))
+    drift = [abs(Decimal(repr(total)) - Decimal(exact).scaleb(-2))
+             for (_, exact), (_, total) in zip(cents, floats)]
+    return {'rows': rows, 'months': len(cents),
+            'cents_seconds': round(cents_seconds, 3),
+            'float_seconds': round(float_seconds, 3),
+            'inexact_months': sum(1 for error in drift if error),
+            'max_drift': max(drift, default=Decimal(0))}
+
+
+def latency_ms(samples):
+    if not samples:
+        return {'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    p50, p99 = np.percentile(samples, [50, 99]) * 1000
+    return {'p50_ms': round(float(p50), 3), 'p99_ms': round(float(p99), 3),
+            'max_ms': round(max(samples) * 1000, 3)}
+
+
+def timed_calls(call, arguments):
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        call(argument)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def contended_updates(app, locking, workers, updates, product_ids, think):
+    counts = {'retries': 0, 'busy': 0}
+    waits = []
+    lock = threading.Lock()
+
+    def run():
+        with app.app_context():
+            session = db.session
+            done = retries = busy = 0
+            while done < updates:
+                try:
+                    if locking:
+                        started = time.perf_counter()
+                        session.execute(text('BEGIN IMMEDIATE'))
+                        with lock:
+                            waits.append(time.perf_counter() - started)
+                    product = session.get(Product,
+                                          random.choice(product_ids))
+                    time.sleep(think)
+                    product.stock_quantity += 1
+                    session.commit()
+                    done += 1
+                except StaleDataError:
+                    session.rollback()
+                    retries += 1
+                except OperationalError:
+                    session.rollback()
+                    busy += 1
+            db.session.remove()
+        with lock:
+            counts['retries'] += retries
+            counts['busy'] += busy
+
+    threads = [threading.Thread(target=run) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return dict(counts, seconds=round(seconds, 3),
+                updates_per_second=round(workers * updates / seconds),
+                lock_wait=latency_ms(waits))
+
+
+def benchmark_contention(session, workers=8, updates=100, products=4,
+                         think=0.001, profile='tuned'):
+    # Optimistic workers read without a lock and retry when the version
+    # moved; locking workers take SQLite's write lock with BEGIN IMMEDIATE
+    # before reading.
+    product_ids = session.execute(
+        select(Product.product_id).order_by(Product.product_id)
+        .limit(products)).scalars().all()
+    results = {'workers': workers, 'updates': workers * updates,
+               'products': len(product_ids)}
+    if not product_ids:
+        return results
+    total = select(func.sum(Product.stock_quantity)).where(
+        Product.product_id.in_(product_ids))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, locking in (('optimistic', False), ('locking', True)):
+            path = os.path.join(directory, f'{name}.db')
+            copy_database(session, path)
+            app = scratch_app(path, profile)
+            with app.app_context():
+                before = db.session.execute(total).scalar()
+                db.session.remove()
+            results[name] = contended_updates(
+                app, locking, workers, updates, product_ids, think)
+            with app.app_context():
+                results[name]['lost_updates'] = (
+                    before + workers * updates -
+                    db.session.execute(total).scalar())
+                db.session.remove()
+            dispose(app)
+    return results
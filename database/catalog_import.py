@@ -0,0 +1,136 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert as core_insert, select
+from sqlalchemy.dialects.sqlite import insert
+from database.database import db, Product, StockMovement
+from database.scan_cache import scan_cache
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_REJECTIONS = 100
+UPDATED_COLUMNS = ('product_name', 'price', 'category', 'description')
+
+
+def parse_text(value, name):
+    text = '' if value is None else str(value).strip()
+    if not text:
+        raise ValueError(f'missing {name}')
+    return text
+
+
+def parse_money(value, name):
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'invalid {name} {value!r}')
+    if not amount.is_finite():
+        raise ValueError(f'invalid {name} {value!r}')
+    if amount < 0:
+        raise ValueError(f'negative {name}')
+    return amount
+
+
+def parse_count(value, name):
+    try:
+        count = int(str(value))
+    except ValueError:
+        raise ValueError(f'invalid {name} {value!r}')
+    if count < 0:
+        raise ValueError(f'negative {name}')
+    return count
+
+
+def parse_row(row, with_stock):
+    product = {'barcode': parse_text(row.get('barcode'), 'barcode'),
+               'product_name': parse_text(row.get('product_name'),
+                                          'product_name'),
+               'price': parse_money(row.get('price') or '', 'price'),
+               'stock_quantity': 0,
+               'category': row.get('category') or None,
+               'description': row.get('description') or None}
+    if with_stock:
+        product['stock_quantity'] = parse_count(
+            row.get('stock_quantity') or 0, 'stock_quantity')
+    return product
+
+
+def upsert_statement(with_stock):
+    statement = insert(Product)
+    columns = UPDATED_COLUMNS + (('stock_quantity',) if with_stock else ())
+    set_ = {name: statement.excluded[name] for name in columns}
+    set_['version'] = Product.version + 1
+    return statement.on_conflict_do_update(
+        index_elements=[Product.barcode], set_=set_)
+
+
+def stock_levels(session, barcodes):
+    return {row.barcode: row for row in session.execute(
+        select(Product.barcode, Product.product_id, Product.stock_quantity)
+        .where(Product.barcode.in_(barcodes)))}
+
+
+def record_stock_adjustments(session, products, before):
+    stock = {product['barcode']: product['stock_quantity']
+             for product in products}
+    after = stock_levels(session, list(stock))
+    movements = []
+    for barcode, quantity in stock.items():
+        previous = before[barcode].stock_quantity if barcode in before else 0
+        if quantity != previous:
+            movements.append({'product_id': after[barcode].product_id,
+                              'movement_type': 'adjustment',
+                              'quantity': quantity - previous,
+                              'notes': 'catalog import'})
+    if movements:
+        session.execute(core_insert(StockMovement), movements)
+
+
+def read_chunks(reader, chunk_size):
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_catalog(stream, chunk_size=CHUNK_SIZE):
+    reader = csv.DictReader(stream)
+    with_stock = 'stock_quantity' in (reader.fieldnames or ())
+    statement = upsert_statement(with_stock)
+    started = time.perf_counter()
+    imported = 0
+    rejected = 0
+    rejections = []
+    for chunk in read_chunks(reader, chunk_size):
+        products = []
+        for line, row in chunk:
+            try:
+                products.append(parse_row(row, with_stock))
+            except ValueError as error:
+                rejected += 1
+                if len(rejections) < MAX_REPORTED_REJECTIONS:
+                    rejections.append(
+                        {'line': line, 'error': str(error)})
+        if products:
+            try:
+                if with_stock:
+                    before = stock_levels(
+                        db.session, [product['barcode']
+                                     for product in products])
+                db.session.execute(statement, products)
+                if with_stock:
+                    record_stock_adjustments(db.session, products, before)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            for product in products:
+                scan_cache.discard(product['barcode'])
+            imported += len(products)
+    seconds = time.perf_counter() - started
+    return {'imported': imported, 'rejected': rejected,
+            'rejections': rejections, 'seconds': round(seconds, 3),
+            'rows_per_second': round(imported / seconds) if seconds else 0}
@@ -0,0 +1,121 @@
+from sqlalchemy import func, select, update
+from database import customer_sketches, daily_sales, top_sellers
+from database.database import db, Product, WarehouseItem
+from database.line_items import insert_sale
+from database.monthly_sales import fold_sale
+from database.scan_cache import scan_cache
+from database.stock_ledger import record_sale_movements
+
+UNSYNCHRONIZED = {'synchronize_session': False}
+
+
+def decrement_product_stock(session, product_id, quantity):
+    # A sale without a warehouse may only draw on stock no warehouse holds;
+    # warehouse units, reserved or not, are sold through their warehouse.
+    held = (select(func.coalesce(func.sum(WarehouseItem.quantity), 0))
+            .where(WarehouseItem.product_id == product_id)
+            .scalar_subquery())
+    return session.execute(
+        update(Product)
+        .where(Product.product_id == product_id,
+               Product.stock_quantity - held >= quantity)
+        .values(stock_quantity=Product.stock_quantity - quantity,
+                version=Product.version + 1)
+        .returning(Product.price, Product.cost_price),
+        execution_options=UNSYNCHRONIZED).first()
+
+
+def product_prices(session, product_id):
+    return session.execute(
+        select(Product.price, Product.cost_price)
+        .where(Product.product_id == product_id)).first()
+
+
+def decrement_warehouse_stock(session, warehouse_id, product_id, quantity):
+    # The stock_sync trigger passes this decrement on to the product row, so
+    # it is guarded there too and can never drive stock_quantity negative.
+    product_stock = (select(Product.stock_quantity)
+                     .where(Product.product_id == product_id)
+                     .scalar_subquery())
+    return session.execute(
+        update(WarehouseItem)
+        .where(WarehouseItem.warehouse_id == warehouse_id,
+               WarehouseItem.product_id == product_id,
+               WarehouseItem.quantity - WarehouseItem.reserved_quantity >=
+               quantity,
+               product_stock >= quantity)
+        .values(quantity=WarehouseItem.quantity - quantity,
+                version=WarehouseItem.version + 1)
+        .returning(WarehouseItem.warehouse_item_id),
+        execution_options=UNSYNCHRONIZED).scalar() is not None
+
+
+def restore_stock(session, lines, warehouse_id=None):
+    for line in lines:
+        product_id, quantity = line[:2]
+        if warehouse_id is None:
+            session.execute(
+                update(Product)
+                .where(Product.product_id == product_id)
+                .values(stock_quantity=Product.stock_quantity + quantity,
+                        version=Product.version + 1),
+                execution_options=UNSYNCHRONIZED)
+        else:
+            session.execute(
+                update(WarehouseItem)
+                .where(WarehouseItem.warehouse_id == warehouse_id,
+                       WarehouseItem.product_id == product_id)
+                .values(quantity=WarehouseItem.quantity + quantity,
+                        version=WarehouseItem.version + 1),
+                execution_options=UNSYNCHRONIZED)
+
+
+def record_sale(session, lines, customer_id=None, user_id=None,
+                payment_method=None, warehouse_id=None, notes=None,
+                on_recorded=None):
+    priced = []
+    failed = []
+    for product_id, quantity in lines:
+        if quantity <= 0:
+            failed.append((product_id, quantity))
+            continue
+        if warehouse_id is None:
+            prices = decrement_product_stock(session, product_id, quantity)
+        elif decrement_warehouse_stock(
+                session, warehouse_id, product_id, quantity):
+            prices = product_prices(session, product_id)
+        else:
+            prices = None
+        if prices is None:
+            failed.append((product_id, quantity))
+            continue
+        priced.append((product_id, quantity, *prices))
+    if failed or not priced:
+        restore_stock(session, priced, warehouse_id)
+        return None, failed, []
+    sale_id = insert_sale(session, priced, customer_id=customer_id,
+                          user_id=user_id, payment_method=payment_method,
+                          notes=notes)
+    record_sale_movements(session, sale_id, priced, warehouse_id)
+    fold_sale(session, sale_id)
+    daily_sales.fold_sale(session, sale_id, warehouse_id)
+    top_sellers.fold_sale(session, sale_id, warehouse_id)
+    customer_sketches.fold_sale(session, sale_id)
+    if on_recorded is not None:
+        on_recorded(session, sale_id)
+    return sale_id, failed, [line[0] for line in priced]
+
+
+def checkout(lines, **values):
+    session = db.session
+    try:
+        sale_id, failed, product_ids = record_sale(session, lines, **values)
+        if sale_id is None:
+            session.rollback()
+            return None, failed
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    scan_cache.discard_products(product_ids)
+    return sale_id, failed
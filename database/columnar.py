@@ -0,0 +1,140 @@
+import json
+import os
+import time
+import numpy as np
+
+CHUNK_SIZE = 100000
+
+# Money columns are stored as integer cents, as in the database. Missing
+# product or customer ids are stored as -1.
+COLUMNS = {
+    'sale_id': '<i8',
+    'sale_date': '<M8[s]',
+    'product_id': '<i8',
+    'customer_id': '<i8',
+    'quantity': '<i8',
+    'unit_price': '<i8',
+    'item_amount': '<i8',
+}
+
+META_FILE = 'meta.json'
+
+UPPER_BOUND_SQL = '''
+    SELECT MAX(sale_id) FROM (
+        SELECT sale_id FROM sale WHERE sale_id > ?
+        ORDER BY sale_id LIMIT ?)
+'''
+
+SALE_ITEMS_SQL = '''
+    SELECT sale_item.sale_id,
+           CAST(strftime('%s', sale.sale_date) AS INTEGER),
+           COALESCE(sale_item.product_id, -1),
+           COALESCE(sale.customer_id, -1),
+           sale_item.quantity, sale_item.unit_price, sale_item.item_amount
+    FROM sale JOIN sale_item ON sale_item.sale_id = sale.sale_id
+    WHERE sale.sale_id > ? AND sale.sale_id <= ?
+    AND sale.sale_date IS NOT NULL
+    ORDER BY sale_item.sale_id, sale_item.sale_item_id
+'''
+
+
+def column_path(directory, name):
+    return os.path.join(directory, f'{name}.bin')
+
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, META_FILE)) as meta:
+            return json.load(meta)
+    except FileNotFoundError:
+        return {'watermark': 0, 'rows': 0}
+
+
+def write_meta(directory, meta):
+    path = os.path.join(directory, META_FILE)
+    with open(path + '.tmp', 'w') as tmp:
+        json.dump(meta, tmp)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def truncate_columns(directory, rows):
+    # Drops the tail of an append that crashed before meta.json was
+    # replaced, so the column files and the recorded row count agree.
+    for name, dtype in COLUMNS.items():
+        path = column_path(directory, name)
+        with open(path, 'ab') as column:
+            column.truncate(rows * np.dtype(dtype).itemsize)
+
+
+def export(session, directory, chunk_size=CHUNK_SIZE):
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    meta = read_meta(directory)
+    truncate_columns(directory, meta['rows'])
+    cursor = session.connection().connection.cursor()
+    appended = 0
+    try:
+        while True:
+            last = cursor.execute(
+                UPPER_BOUND_SQL, (meta['watermark'], chunk_size)).fetchone()[0]
+            if last is None:
+                break
+            rows = cursor.execute(
+                SALE_ITEMS_SQL, (meta['watermark'], last)).fetchall()
+            data = np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+            for index, name in enumerate(COLUMNS):
+                with open(column_path(directory, name), 'ab') as column:
+                    column.write(np.ascontiguousarray(data[:, index]).data)
+                    column.flush()
+                    os.fsync(column.fileno())
+            meta = {'watermark': last, 'rows': meta['rows'] + len(data)}
+            write_meta(directory, meta)
+            appended += len(data)
+    finally:
+        cursor.close()
+    return {'appended': appended, 'rows': meta['rows'],
+            'watermark': meta['watermark'],
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+class SalesSnapshot:
+    def __init__(self, directory):
+        meta = read_meta(directory)
+        self.watermark = meta['watermark']
+        self.rows = meta['rows']
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            if self.rows:
+                self.columns[name] = np.memmap(
+                    column_path(directory, name), dtype=dtype, mode='r',
+                    shape=(self.rows,))
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def totals_by(self, name):
+        # Ids are small non-negative integers, so a bincount indexed by id
+        # (shifted past the -1 placeholder) replaces a sort-based group by.
+        keys = self[name] + 1
+        present = np.flatnonzero(np.bincount(keys))
+        quantity = np.bincount(keys, weights=self['quantity'])[present]
+        revenue = np.bincount(keys, weights=self['item_amount'])[present]
+        return (present - 1, np.rint(quantity).astype(np.int64),
+                np.rint(revenue).astype(np.int64))
+
+    def monthly_totals(self):
+        months = self['sale_date'].astype('datetime64[M]').view(np.int64)
+        if not len(months):
+            return np.empty(0, dtype='datetime64[M]'), np.empty(0, np.int64)
+        first = months.min()
+        revenue = np.bincount(months - first, weights=self['item_amount'])
+        present = np.flatnonzero(np.bincount(months - first))
+        return ((present + first).astype('datetime64[M]'),
+                np.rint(revenue[present]).astype(np.int64))
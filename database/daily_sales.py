@@ -0,0 +1,125 @@
+import time
+from sqlalchemy import func, literal_column, select, text, type_coerce
+from database.database import DailySales, Money
+
+DIMENSIONS = ('category', 'product_id', 'warehouse_id', 'user_id',
+              'payment_method')
+
+PERIODS = {
+    'day': '{day}',
+    'week': "date({day}, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m', {day})",
+    'quarter': "strftime('%Y', {day}) || '-Q' || "
+               "((CAST(strftime('%m', {day}) AS INTEGER) + 2) / 3)",
+    'year': "strftime('%Y', {day})",
+}
+
+SALE_WAREHOUSE = '''COALESCE((
+    SELECT MAX(stock_movement.warehouse_id) FROM stock_movement
+    WHERE stock_movement.sale_id = sale.sale_id), 0)'''
+
+FOLD_SQL = '''
+    INSERT INTO daily_sales (
+        day, category, product_id, warehouse_id, user_id, payment_method,
+        lines, quantity, revenue, profit)
+    SELECT date(sale.sale_date), COALESCE(product.category, ''),
+           sale_item.product_id, {warehouse}, COALESCE(sale.user_id, 0),
+           COALESCE(sale.payment_method, ''), COUNT(*),
+           SUM(sale_item.quantity), SUM(sale_item.item_amount),
+           SUM(sale_item.item_amount
+               - sale_item.unit_cost * sale_item.quantity)
+    FROM sale
+    JOIN sale_item ON sale_item.sale_id = sale.sale_id
+    LEFT JOIN product ON product.product_id = sale_item.product_id
+    WHERE {condition} AND sale.sale_date IS NOT NULL
+    AND sale_item.product_id IS NOT NULL
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ON CONFLICT (day, category, product_id, warehouse_id, user_id,
+                 payment_method)
+    DO UPDATE SET lines = lines + excluded.lines,
+                  quantity = quantity + excluded.quantity,
+                  revenue = revenue + excluded.revenue,
+                  profit = profit + excluded.profit
+'''
+
+
+def fold_sale(session, sale_id, warehouse_id=None):
+    session.execute(text(FOLD_SQL.format(
+        warehouse=':warehouse_id', condition='sale.sale_id = :sale_id')),
+        {'sale_id': sale_id, 'warehouse_id': warehouse_id or 0})
+
+
+def rebuild(session):
+    session.execute(text('DELETE FROM daily_sales'))
+    session.execute(text(FOLD_SQL.format(
+        warehouse=SALE_WAREHOUSE, condition='1')))
+
+
+def report(session, period='month', dimensions=(), start=None, end=None):
+    if period not in PERIODS:
+        raise ValueError(f'unknown period {period}')
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f'unknown dimensions {", ".join(sorted(unknown))}')
+    bucket = literal_column(
+        PERIODS[period].format(day='day')).label('period')
+    columns = [DailySales.__table__.columns[name] for name in dimensions]
+    query = (
+        select(bucket, *columns,
+               func.sum(DailySales.lines).label('lines'),
+               func.sum(DailySales.quantity).label('quantity'),
+               type_coerce(func.sum(DailySales.revenue), Money)
+               .label('revenue'),
+               type_coerce(func.sum(DailySales.profit), Money)
+               .label('profit'))
+        .group_by(bucket, *columns)
+        .order_by(bucket, *columns))
+    if start is not None:
+        query = query.where(DailySales.day >= start)
+    if end is not None:
+        query = query.where(DailySales.day < end)
+    return [row._asdict() for row in session.execute(query)]
+
+
+def raw_report(session, period='month', dimensions=()):
+    bucket = PERIODS[period].format(day='date(sale.sale_date)')
+    keys = {
+        'category': "COALESCE(product.category, '')",
+        'product_id': 'sale_item.product_id',
+        'warehouse_id': SALE_WAREHOUSE,
+        'user_id': 'COALESCE(sale.user_id, 0)',
+        'payment_method': "COALESCE(sale.payment_method, '')",
+    }
+    selected = ''.join(f', {keys[name]}' for name in dimensions)
+    groups = ', '.join(str(number) for number in range(
+        1, len(dimensions) + 2))
+    return session.execute(text(f'''
+        SELECT {bucket}{selected}, COUNT(*) AS lines,
+               SUM(sale_item.quantity) AS quantity,
+               SUM(sale_item.item_amount) AS revenue,
+               SUM(sale_item.item_amount
+                   - sale_item.unit_cost * sale_item.quantity) AS profit
+        FROM sale
+        JOIN sale_item ON sale_item.sale_id = sale.sale_id
+        LEFT JOIN product ON product.product_id = sale_item.product_id
+        WHERE sale.sale_date IS NOT NULL
+        AND sale_item.product_id IS NOT NULL
+        GROUP BY {groups}
+        ORDER BY {groups}
+    ''').columns(revenue=Money, profit=Money)).all()
+
+
+def benchmark(session, period='month', dimensions=()):
+    started = time.perf_counter()
+    rolled = report(session, period, dimensions)
+    cube_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    raw = raw_report(session, period, dimensions)
+    raw_seconds = time.perf_counter() - started
+    cube_rows = session.execute(text('SELECT COUNT(*) FROM daily_sales'))
+    return {'rows': len(rolled),
+            'cube_rows': cube_rows.scalar(),
+            'raw_seconds': round(raw_seconds, 3),
+            'cube_seconds': round(cube_seconds, 3),
+            'matches': ([tuple(row) for row in raw] ==
+                        [tuple(row.values()) for row in rolled])}
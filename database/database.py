@@ -1,20 +1,83 @@
 import os
+from decimal import Decimal, ROUND_HALF_UP
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.types import TypeDecorator
+
+ENGINE_PROFILES = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    },
+}
 
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///inventory.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "SQLALCHEMY_DATABASE_URI", "sqlite:///inventory.db")
+app.config["SQLALCHEMY_ENGINE_PROFILE"] = os.environ.get(
+    "SQLALCHEMY_ENGINE_PROFILE", "tuned")
 db = SQLAlchemy(app)
 
 
+def install_engine_profile(app):
+    pragmas = ENGINE_PROFILES[app.config["SQLALCHEMY_ENGINE_PROFILE"]]
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+install_engine_profile(app)
+
+
+class Money(TypeDecorator):
+    impl = db.Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        cents = Decimal(str(value)).scaleb(2)
+        return int(cents.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-2)
+
+
 class Product(db.Model):
     product_id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.Text, nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(Money, nullable=False)
+    cost_price = db.Column(Money, nullable=False, default=0,
+                           server_default='0')
     stock_quantity = db.Column(db.Integer, nullable=False)
     barcode = db.Column(db.Text, unique=True)
-    category = db.Column(db.Text)
+    category = db.Column(db.Text, index=True)
     description = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<Product {self.product_name}>'
@@ -32,17 +95,25 @@ class Customer(db.Model):
 
 
 class Sale(db.Model):
+    __table_args__ = (
+        db.Index('ix_sale_sale_date_customer_id', 'sale_date', 'customer_id'),
+    )
+
     sale_id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
+    customer_id = db.Column(
+        db.Integer, db.ForeignKey('customer.customer_id'), index=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), index=True)
     sale_date = db.Column(
         db.TIMESTAMP, server_default=db.func.current_timestamp())
-    total_amount = db.Column(db.Float, nullable=False)
+    total_amount = db.Column(Money, nullable=False)
     payment_method = db.Column(db.Text)
     notes = db.Column(db.Text)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    customer = db.relationship('Customer', backref='sales')
-    user = db.relationship('User', backref='sales')
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('user.user_id'), index=True)
+    customer = db.relationship(
+        'Customer', backref=db.backref('sales', lazy='dynamic'))
+    user = db.relationship('User', backref=db.backref('sales', lazy='dynamic'))
 
     def __repr__(self):
         return f'<Sale {self.sale_id}>'
@@ -50,20 +121,27 @@ class Sale(db.Model):
 
 class SaleItem(db.Model):
     sale_item_id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sale.sale_id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
+    sale_id = db.Column(
+        db.Integer, db.ForeignKey('sale.sale_id'), index=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    item_amount = db.Column(db.Float, nullable=False)
-    sale = db.relationship('Sale', backref='items')
-    product = db.relationship('Product', backref='sales')
+    unit_price = db.Column(Money, nullable=False)
+    item_amount = db.Column(Money, nullable=False)
+    unit_cost = db.Column(Money, nullable=False, default=0,
+                          server_default='0')
+    sale = db.relationship(
+        'Sale', backref=db.backref('items', lazy='selectin'))
+    product = db.relationship(
+        'Product', backref=db.backref('sales', lazy='dynamic'))
 
     def __repr__(self):
         return f'<SaleItem {self.sale_item_id}>'
 
 
 class User(db.Model):
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'))
+    customer_id = db.Column(
+        db.Integer, db.ForeignKey('customer.customer_id'), index=True)
     customer_name = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.Text, nullable=False, unique=True)
@@ -76,32 +154,53 @@ class User(db.Model):
 
 
 class Order(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_order_date_customer_id',
+                 'order_date', 'customer_id'),
+    )
+
     order_id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
+    customer_id = db.Column(
+        db.Integer, db.ForeignKey('customer.customer_id'), index=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), index=True)
     order_date = db.Column(
         db.TIMESTAMP, server_default=db.func.current_timestamp())
     quantity = db.Column(db.Integer, nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
+    total_amount = db.Column(Money, nullable=False)
     payment_method = db.Column(db.Text)
     notes = db.Column(db.Text)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.user_id'))
-    customer = db.relationship('Customer', backref='orders')
-    user = db.relationship('User', backref='orders')
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('user.user_id'), index=True)
+    customer = db.relationship(
+        'Customer', backref=db.backref('orders', lazy='dynamic'))
+    user = db.relationship(
+        'User', backref=db.backref('orders', lazy='dynamic'))
 
     def __repr__(self):
         return f'<Order {self.order_id}>'
 
 
 class OrderItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_item_warehouse_id_product_id',
+                 'warehouse_id', 'product_id'),
+    )
+
     order_item_id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.order_id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
+    order_id = db.Column(
+        db.Integer, db.ForeignKey('order.order_id'), index=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    item_amount = db.Column(db.Float, nullable=False)
-    order = db.relationship('Order', backref='items')
-    product = db.relationship('Product', backref='orders')
+    unit_price = db.Column(Money, nullable=False)
+    item_amount = db.Column(Money, nullable=False)
+    warehouse_id = db.Column(
+        db.Integer, db.ForeignKey('warehouse.warehouse_id'))
+    order = db.relationship(
+        'Order', backref=db.backref('items', lazy='selectin'))
+    product = db.relationship(
+        'Product', backref=db.backref('orders', lazy='dynamic'))
 
     def __repr__(self):
         return f'<OrderItem {self.order_item_id}>'
@@ -119,13 +218,27 @@ class Warehouse(db.Model):
 
 
 class WarehouseItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_warehouse_item_warehouse_id_product_id',
+                 'warehouse_id', 'product_id', unique=True),
+    )
+
     warehouse_item_id = db.Column(db.Integer, primary_key=True)
     warehouse_id = db.Column(
         db.Integer, db.ForeignKey('warehouse.warehouse_id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'))
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    warehouse = db.relationship('Warehouse', backref='items')
-    product = db.relationship('Product', backref='warehouses')
+    reserved_quantity = db.Column(db.Integer, nullable=False, default=0,
+                                  server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+    warehouse = db.relationship(
+        'Warehouse', backref=db.backref('items', lazy='dynamic'))
+    product = db.relationship(
+        'Product', backref=db.backref('warehouses', lazy='selectin'))
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<WarehouseItem {self.warehouse_item_id}>'
@@ -134,8 +247,8 @@ class WarehouseItem(db.Model):
 class MonthlySales(db.Model):
     month = db.Column(db.Text, primary_key=True)
     sales = db.Column(db.Float, nullable=False)
-    profit = db.Column(db.Float, nullable=False)
-    revenue = db.Column(db.Float, nullable=False)
+    profit = db.Column(Money, nullable=False)
+    revenue = db.Column(Money, nullable=False)
     profit_margin = db.Column(db.Float, nullable=False)
     revenue_growth = db.Column(db.Float, nullable=False)
     profit_growth = db.Column(db.Float, nullable=False)
@@ -145,11 +258,100 @@ class MonthlySales(db.Model):
     profit_per_customer = db.Column(db.Float, nullable=False)
     revenue_per_product = db.Column(db.Float, nullable=False)
     profit_per_product = db.Column(db.Float, nullable=False)
+    customers = db.Column(db.Integer, nullable=False, default=0,
+                          server_default='0')
+    products = db.Column(db.Integer, nullable=False, default=0,
+                         server_default='0')
 
     def __repr__(self):
         return f'<MonthlySales {self.month}>'
 
 
+class MonthlySalesCustomer(db.Model):
+    month = db.Column(db.Text, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey(
+        'customer.customer_id'), primary_key=True)
+
+    def __repr__(self):
+        return f'<MonthlySalesCustomer {self.month} {self.customer_id}>'
+
+
+class MonthlySalesProduct(db.Model):
+    month = db.Column(db.Text, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey(
+        'product.product_id'), primary_key=True)
+
+    def __repr__(self):
+        return f'<MonthlySalesProduct {self.month} {self.product_id}>'
+
+
+class DailySales(db.Model):
+    # Missing dimensions are stored as 0 / '' rather than NULL so that every
+    # sale line folds into exactly one primary-key row.
+    day = db.Column(db.Text, primary_key=True)
+    category = db.Column(db.Text, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    warehouse_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    payment_method = db.Column(db.Text, primary_key=True)
+    lines = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    revenue = db.Column(Money, nullable=False)
+    profit = db.Column(Money, nullable=False)
+
+    def __repr__(self):
+        return f'<DailySales {self.day} {self.product_id}>'
+
+
+class TopSeller(db.Model):
+    __table_args__ = (
+        db.Index('ix_top_seller_period_scope_count', 'period',
+                 'period_start', 'scope', 'scope_key', 'count'),
+    )
+
+    period = db.Column(db.Text, primary_key=True)
+    period_start = db.Column(db.Text, primary_key=True)
+    scope = db.Column(db.Text, primary_key=True)
+    scope_key = db.Column(db.Text, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    error = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<TopSeller {self.period_start} {self.product_id}>'
+
+
+class CustomerSketch(db.Model):
+    scope = db.Column(db.Text, primary_key=True)
+    scope_key = db.Column(db.Text, primary_key=True)
+    day = db.Column(db.Text, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<CustomerSketch {self.scope} {self.scope_key} {self.day}>'
+
+
+class ReorderSuggestion(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey(
+        'product.product_id'), primary_key=True)
+    # 0 for the product across all stock, otherwise one WarehouseItem.
+    warehouse_id = db.Column(db.Integer, primary_key=True)
+    demand_rate = db.Column(db.Float, nullable=False)
+    demand_std = db.Column(db.Float, nullable=False)
+    on_hand = db.Column(db.Integer, nullable=False)
+    safety_stock = db.Column(db.Integer, nullable=False)
+    reorder_point = db.Column(db.Integer, nullable=False)
+    order_quantity = db.Column(db.Integer, nullable=False)
+    through_sale_id = db.Column(db.Integer, nullable=False, index=True)
+    through_movement_id = db.Column(db.Integer, nullable=False, default=0,
+                                    server_default='0')
+    computed_at = db.Column(
+        db.TIMESTAMP, server_default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f'<ReorderSuggestion {self.product_id} {self.warehouse_id}>'
+
+
 class InactiveAccount(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey(
         'user.user_id'), primary_key=True)
@@ -167,8 +369,85 @@ class Delivery(db.Model):
     delivery_date = db.Column(
         db.TIMESTAMP, server_default=db.func.current_timestamp())
     delivery_status = db.Column(db.Text)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.order_id'))
-    order = db.relationship('Order', backref='deliveries')
+    order_id = db.Column(
+        db.Integer, db.ForeignKey('order.order_id'), index=True)
+    order = db.relationship(
+        'Order', backref=db.backref('deliveries', lazy='selectin'))
 
     def __repr__(self):
         return f'<Delivery {self.delivery_id}>'
+
+
+class StockHold(db.Model):
+    hold_id = db.Column(db.Integer, primary_key=True)
+    order_item_id = db.Column(
+        db.Integer, db.ForeignKey('order_item.order_item_id'),
+        nullable=False, index=True)
+    warehouse_item_id = db.Column(
+        db.Integer, db.ForeignKey('warehouse_item.warehouse_item_id'),
+        nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.TIMESTAMP, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<StockHold {self.hold_id}>'
+
+
+class IdempotencyKey(db.Model):
+    endpoint = db.Column(db.Text, primary_key=True)
+    idempotency_key = db.Column(db.Text, primary_key=True)
+    request_hash = db.Column(db.Text, nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response_body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(
+        db.TIMESTAMP, server_default=db.func.current_timestamp(), index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.endpoint} {self.idempotency_key}>'
+
+
+class StockMovement(db.Model):
+    __table_args__ = (
+        db.Index('ix_stock_movement_product_id_warehouse_id_movement_id',
+                 'product_id', 'warehouse_id', 'movement_id'),
+    )
+
+    movement_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), nullable=False)
+    warehouse_id = db.Column(
+        db.Integer, db.ForeignKey('warehouse.warehouse_id'), index=True)
+    movement_type = db.Column(db.Text, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    movement_date = db.Column(
+        db.TIMESTAMP, server_default=db.func.current_timestamp())
+    sale_id = db.Column(
+        db.Integer, db.ForeignKey('sale.sale_id'), index=True)
+    notes = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<StockMovement {self.movement_id}>'
+
+
+class StockSnapshot(db.Model):
+    __table_args__ = (
+        db.Index('ix_stock_snapshot_product_id_warehouse_id_snapshot_date',
+                 'product_id', 'warehouse_id', 'snapshot_date'),
+        db.Index('ix_stock_snapshot_product_id_warehouse_id_movement_id',
+                 'product_id', 'warehouse_id', 'movement_id'),
+        db.Index('ix_stock_snapshot_warehouse_id_movement_id',
+                 'warehouse_id', 'movement_id'),
+    )
+
+    snapshot_id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.product_id'), nullable=False)
+    warehouse_id = db.Column(
+        db.Integer, db.ForeignKey('warehouse.warehouse_id'))
+    quantity = db.Column(db.Integer, nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    snapshot_date = db.Column(
+        db.TIMESTAMP, server_default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f'<StockSnapshot {self.snapshot_id}>'
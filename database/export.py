@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+from sqlalchemy import select
+from database.database import db, Sale, SaleItem
+
+BATCH_SIZE = 1000
+EXPORT_COLUMNS = (
+    Sale.sale_id, Sale.sale_date, Sale.customer_id, Sale.user_id,
+    Sale.payment_method, Sale.total_amount, SaleItem.sale_item_id,
+    SaleItem.product_id, SaleItem.quantity, SaleItem.unit_price,
+    SaleItem.item_amount,
+)
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def sales_query(start=None, end=None, customer_id=None, payment_method=None):
+    query = (select(*EXPORT_COLUMNS)
+             .outerjoin(SaleItem, SaleItem.sale_id == Sale.sale_id)
+             .order_by(Sale.sale_id, SaleItem.sale_item_id))
+    if start is not None:
+        query = query.where(Sale.sale_date >= start)
+    if end is not None:
+        query = query.where(Sale.sale_date < end)
+    if customer_id is not None:
+        query = query.where(Sale.customer_id == customer_id)
+    if payment_method is not None:
+        query = query.where(Sale.payment_method == payment_method)
+    return query
+
+
+def iter_sales(batch_size=BATCH_SIZE, **filters):
+    result = db.session.execute(
+        sales_query(**filters), execution_options={'yield_per': batch_size})
+    for partition in result.partitions():
+        yield partition
+
+
+def iter_csv(batch_size=BATCH_SIZE, **filters):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+    for rows in iter_sales(batch_size, **filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def iter_ndjson(batch_size=BATCH_SIZE, **filters):
+    for rows in iter_sales(batch_size, **filters):
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + '\n'
+            for row in rows)
@@ -0,0 +1,152 @@
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy import select
+from database.benchmarks import copy_database, dispose, scratch_app
+from database.checkout import checkout, record_sale
+from database.database import db, Product
+from database.scan_cache import scan_cache
+
+MAX_BATCH = 100
+MAX_DELAY = 0.005
+
+# A caller's future resolves only after the batch holding its sale has
+# committed, so an acknowledged sale is as durable as a directly committed
+# one under the engine profile's synchronous setting. Sales still queued when
+# the process dies were never acknowledged and are lost.
+
+
+class GroupCommitWriter:
+    def __init__(self, app, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.records = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name='group-commit-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, lines, **values):
+        future = Future()
+        self._queue.put((future, list(lines), values))
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                batch = self._collect(job)
+                try:
+                    self._commit(batch)
+                except Exception:
+                    for job in batch:
+                        self._commit([job])
+
+    def _commit(self, batch):
+        session = db.session
+        results = []
+        try:
+            for future, lines, values in batch:
+                results.append(record_sale(session, lines, **values))
+            session.commit()
+        except Exception as error:
+            session.rollback()
+            if len(batch) > 1:
+                raise
+            batch[0][0].set_exception(error)
+            return
+        self.batches += 1
+        self.records += len(batch)
+        for (future, _, _), (sale_id, failed, product_ids) in zip(batch,
+                                                                  results):
+            scan_cache.discard_products(product_ids)
+            future.set_result((sale_id, failed))
+
+
+def run_clients(app, sell, sales, clients):
+    counts = {'sold': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def run(count):
+        with app.app_context():
+            for _ in range(count):
+                sale_id, _ = sell()
+                with lock:
+                    counts['sold' if sale_id is not None else 'failed'] += 1
+            db.session.remove()
+
+    threads = [threading.Thread(target=run, args=(count,))
+               for count in [sales // clients] * clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    total = counts['sold'] + counts['failed']
+    return dict(counts, seconds=round(seconds, 3),
+                sales_per_second=round(total / seconds) if seconds else 0)
+
+
+def benchmark(session, sales=2000, clients=16, profile='tuned'):
+    product_ids = session.execute(
+        select(Product.product_id).where(Product.stock_quantity > 0)
+        .order_by(Product.stock_quantity.desc()).limit(100)).scalars().all()
+    if not product_ids:
+        return {'sales': 0, 'clients': clients}
+
+    def lines():
+        return [(random.choice(product_ids), 1)]
+
+    results = {'sales': sales // clients * clients, 'clients': clients}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('direct', 'group'):
+            path = os.path.join(directory, f'{mode}.db')
+            copy_database(session, path)
+            app = scratch_app(path, profile)
+            if mode == 'direct':
+                results[mode] = run_clients(
+                    app, lambda: checkout(lines()), sales, clients)
+            else:
+                writer = GroupCommitWriter(app).start()
+                try:
+                    results[mode] = run_clients(
+                        app, lambda: writer.submit(lines()).result(),
+                        sales, clients)
+                finally:
+                    writer.stop()
+                results[mode]['batches'] = writer.batches
+            dispose(app)
+    return results
@@ -0,0 +1,49 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from database.database import IdempotencyKey
+
+DEFAULT_TTL = timedelta(hours=24)
+PURGE_CHUNK_SIZE = 1000
+
+
+def request_hash(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def find_response(session, endpoint, key):
+    return session.execute(
+        select(IdempotencyKey.request_hash, IdempotencyKey.status_code,
+               IdempotencyKey.response_body)
+        .where(IdempotencyKey.endpoint == endpoint,
+               IdempotencyKey.idempotency_key == key)).first()
+
+
+def store_response(session, endpoint, key, fingerprint, status_code, body):
+    session.execute(insert(IdempotencyKey).values(
+        endpoint=endpoint, idempotency_key=key, request_hash=fingerprint,
+        status_code=status_code, response_body=json.dumps(body)))
+
+
+def purge_expired(session, ttl=DEFAULT_TTL, chunk_size=PURGE_CHUNK_SIZE):
+    cutoff = datetime.utcnow() - ttl
+    purged = 0
+    while True:
+        expired = (select(IdempotencyKey.idempotency_key)
+                   .where(IdempotencyKey.created_at < cutoff)
+                   .limit(chunk_size))
+        try:
+            deleted = session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.created_at < cutoff,
+                       IdempotencyKey.idempotency_key.in_(expired)),
+                execution_options={'synchronize_session': False}).rowcount
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        purged += deleted
+        if deleted < chunk_size:
+            return purged
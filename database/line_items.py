@@ -0,0 +1,82 @@
+import time
+from decimal import Decimal
+from sqlalchemy import insert, select
+from database.database import Order, OrderItem, Product, Sale, SaleItem
+
+
+def price_lines(lines):
+    rows = []
+    total = Decimal('0.00')
+    quantity_total = 0
+    for product_id, quantity, unit_price in lines:
+        unit_price = Decimal(str(unit_price))
+        item_amount = unit_price * quantity
+        rows.append({'product_id': product_id, 'quantity': quantity,
+                     'unit_price': unit_price, 'item_amount': item_amount})
+        total += item_amount
+        quantity_total += quantity
+    return rows, total, quantity_total
+
+
+def insert_sale(session, lines, **values):
+    lines = list(lines)
+    rows, total, _ = price_lines(line[:3] for line in lines)
+    for row, line in zip(rows, lines):
+        row['unit_cost'] = line[3] if len(line) > 3 else 0
+    sale_id = session.execute(
+        insert(Sale).values(total_amount=total, **values)
+        .returning(Sale.sale_id)).scalar()
+    if rows:
+        for row in rows:
+            row['sale_id'] = sale_id
+        session.execute(insert(SaleItem), rows)
+    return sale_id
+
+
+def insert_order(session, lines, **values):
+    rows, total, quantity_total = price_lines(lines)
+    values.setdefault('quantity', quantity_total)
+    order_id = session.execute(
+        insert(Order).values(total_amount=total, **values)
+        .returning(Order.order_id)).scalar()
+    if rows:
+        for row in rows:
+            row['order_id'] = order_id
+        session.execute(insert(OrderItem), rows)
+    return order_id
+
+
+def add_sale_objects(session, lines, **values):
+    sale = Sale(total_amount=0, **values)
+    session.add(sale)
+    total = Decimal('0.00')
+    for product_id, quantity, unit_price in lines:
+        unit_price = Decimal(str(unit_price))
+        item = SaleItem(sale=sale, product_id=product_id, quantity=quantity,
+                        unit_price=unit_price,
+                        item_amount=unit_price * quantity)
+        session.add(item)
+        total += item.item_amount
+    sale.total_amount = total
+    session.flush()
+    return sale.sale_id
+
+
+def benchmark(session, lines=1000, rounds=5):
+    product_ids = session.execute(
+        select(Product.product_id).limit(lines)).scalars().all()
+    if not product_ids:
+        raise ValueError('the benchmark needs at least one product')
+    basket = [(product_ids[index % len(product_ids)], 1 + index % 3, '2.50')
+              for index in range(lines)]
+    seconds = {}
+    for name, insert_lines in (('bulk', insert_sale),
+                               ('objects', add_sale_objects)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            insert_lines(session, basket)
+            session.rollback()
+        seconds[name] = round((time.perf_counter() - started) / rounds, 4)
+    return {'lines': lines, 'rounds': rounds,
+            'bulk_seconds': seconds['bulk'],
+            'objects_seconds': seconds['objects']}
@@ -0,0 +1,134 @@
+from sqlalchemy import Float, inspect, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+from database.database import db, Money
+from database.search import install_product_search
+from database.stock_sync import install_stock_sync
+
+
+def merge_duplicate_warehouse_items(connection):
+    connection.execute(text('''
+        UPDATE warehouse_item SET quantity = (
+            SELECT SUM(w.quantity) FROM warehouse_item w
+            WHERE w.warehouse_id = warehouse_item.warehouse_id
+            AND w.product_id = warehouse_item.product_id)
+        WHERE warehouse_item_id IN (
+            SELECT MIN(warehouse_item_id) FROM warehouse_item
+            WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL
+            GROUP BY warehouse_id, product_id HAVING COUNT(*) > 1)
+    '''))
+    connection.execute(text('''
+        DELETE FROM warehouse_item
+        WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL
+        AND warehouse_item_id NOT IN (
+            SELECT MIN(warehouse_item_id) FROM warehouse_item
+            WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL
+            GROUP BY warehouse_id, product_id)
+    '''))
+
+
+def rebuild_table(connection, table, expressions):
+    existing = {c['name'] for c in inspect(connection).get_columns(table.name)}
+    columns = [c.name for c in table.columns if c.name in existing]
+    new_table = table.to_metadata(db.metadata, name=f'_new_{table.name}')
+    try:
+        connection.execute(CreateTable(new_table))
+    finally:
+        db.metadata.remove(new_table)
+    column_list = ', '.join(f'"{name}"' for name in columns)
+    select_list = ', '.join(
+        expressions.get(name, f'"{name}"') for name in columns)
+    connection.execute(text(
+        f'INSERT INTO "{new_table.name}" ({column_list}) '
+        f'SELECT {select_list} FROM "{table.name}"'))
+    connection.execute(text(f'DROP TABLE "{table.name}"'))
+    connection.execute(text(
+        f'ALTER TABLE "{new_table.name}" RENAME TO "{table.name}"'))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def convert_money_columns(connection):
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name']: c['type']
+                    for c in inspector.get_columns(table.name)}
+        expressions = {
+            column.name: f'CAST(ROUND("{column.name}" * 100) AS INTEGER)'
+            for column in table.columns
+            if isinstance(column.type, Money)
+            and isinstance(existing.get(column.name), Float)
+        }
+        if expressions:
+            rebuild_table(connection, table, expressions)
+
+
+def add_missing_columns(connection):
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                definition = CreateColumn(column).compile(
+                    dialect=connection.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN {definition}'))
+
+
+def seed_stock_ledger(connection):
+    if connection.execute(
+            text('SELECT 1 FROM stock_movement LIMIT 1')).first():
+        return
+    connection.execute(text('''
+        INSERT INTO stock_movement (product_id, warehouse_id, movement_type,
+                                    quantity, notes)
+        SELECT product_id, warehouse_id, 'adjustment', quantity,
+               'opening balance'
+        FROM warehouse_item
+        WHERE product_id IS NOT NULL AND warehouse_id IS NOT NULL
+        AND quantity != 0
+    '''))
+    connection.execute(text('''
+        INSERT INTO stock_movement (product_id, movement_type, quantity, notes)
+        SELECT product.product_id, 'adjustment',
+               product.stock_quantity - COALESCE(SUM(warehouse_item.quantity),
+                                                 0),
+               'opening balance'
+        FROM product LEFT JOIN warehouse_item
+            ON warehouse_item.product_id = product.product_id
+            AND warehouse_item.warehouse_id IS NOT NULL
+        GROUP BY product.product_id
+        HAVING product.stock_quantity != COALESCE(SUM(warehouse_item.quantity),
+                                                  0)
+    '''))
+
+
+def create_missing_indexes(connection):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def upgrade():
+    with db.engine.connect() as connection:
+        foreign_keys = connection.exec_driver_sql(
+            'PRAGMA foreign_keys').scalar()
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        connection.commit()
+        try:
+            with connection.begin():
+                convert_money_columns(connection)
+                add_missing_columns(connection)
+                db.metadata.create_all(connection)
+                merge_duplicate_warehouse_items(connection)
+                create_missing_indexes(connection)
+                install_product_search(connection)
+                seed_stock_ledger(connection)
+                install_stock_sync(connection)
+                connection.execute(text('ANALYZE'))
+        finally:
+            connection.exec_driver_sql(f'PRAGMA foreign_keys={foreign_keys}')
+            connection.commit()
@@ -0,0 +1,130 @@
+from sqlalchemy import text
+
+MONTH = "strftime('%Y-%m', sale.sale_date)"
+
+REFRESH_RATIOS_SQL = '''
+    UPDATE monthly_sales SET
+        profit_margin = CASE WHEN revenue
+            THEN profit * 1.0 / revenue ELSE 0 END,
+        revenue_per_sale = CASE WHEN sales
+            THEN revenue / 100.0 / sales ELSE 0 END,
+        profit_per_sale = CASE WHEN sales
+            THEN profit / 100.0 / sales ELSE 0 END,
+        revenue_per_customer = CASE WHEN customers
+            THEN revenue / 100.0 / customers ELSE 0 END,
+        profit_per_customer = CASE WHEN customers
+            THEN profit / 100.0 / customers ELSE 0 END,
+        revenue_per_product = CASE WHEN products
+            THEN revenue / 100.0 / products ELSE 0 END,
+        profit_per_product = CASE WHEN products
+            THEN profit / 100.0 / products ELSE 0 END,
+        revenue_growth = COALESCE((
+            SELECT (monthly_sales.revenue - previous.revenue) * 1.0
+                / previous.revenue
+            FROM monthly_sales AS previous
+            WHERE previous.month = strftime(
+                '%Y-%m', monthly_sales.month || '-01', '-1 month')
+            AND previous.revenue != 0), 0),
+        profit_growth = COALESCE((
+            SELECT (monthly_sales.profit - previous.profit) * 1.0
+                / abs(previous.profit)
+            FROM monthly_sales AS previous
+            WHERE previous.month = strftime(
+                '%Y-%m', monthly_sales.month || '-01', '-1 month')
+            AND previous.profit != 0), 0)
+'''
+
+
+def refresh_ratios(session, month=None):
+    if month is None:
+        session.execute(text(REFRESH_RATIOS_SQL))
+        return
+    session.execute(text(REFRESH_RATIOS_SQL + '''
+        WHERE month IN (:month, strftime('%Y-%m', :month || '-01',
+                                         '+1 month'))
+    '''), {'month': month})
+
+
+def fold_sale(session, sale_id):
+    params = {'sale_id': sale_id}
+    sale = session.execute(text(f'''
+        SELECT {MONTH} AS month, sale.customer_id,
+               COALESCE(SUM(sale_item.item_amount), 0) AS revenue,
+               COALESCE(SUM(sale_item.unit_cost * sale_item.quantity), 0)
+                   AS cost
+        FROM sale LEFT JOIN sale_item ON sale_item.sale_id = sale.sale_id
+        WHERE sale.sale_id = :sale_id
+        GROUP BY sale.sale_id
+    '''), params).one()
+    params.update(month=sale.month, customer_id=sale.customer_id,
+                  revenue=sale.revenue, profit=sale.revenue - sale.cost)
+    session.execute(text('''
+        INSERT OR IGNORE INTO monthly_sales (
+            month, sales, profit, revenue, profit_margin, revenue_growth,
+            profit_growth, revenue_per_sale, profit_per_sale,
+            revenue_per_customer, profit_per_customer, revenue_per_product,
+            profit_per_product, customers, products)
+        VALUES (:month, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+    '''), params)
+    new_customers = 0
+    if sale.customer_id is not None:
+        new_customers = session.execute(text('''
+            INSERT OR IGNORE INTO monthly_sales_customer (month, customer_id)
+            VALUES (:month, :customer_id)
+        '''), params).rowcount
+    new_products = session.execute(text('''
+        INSERT OR IGNORE INTO monthly_sales_product (month, product_id)
+        SELECT DISTINCT :month, product_id FROM sale_item
+        WHERE sale_id = :sale_id AND product_id IS NOT NULL
+    '''), params).rowcount
+    params.update(new_customers=new_customers, new_products=new_products)
+    session.execute(text('''
+        UPDATE monthly_sales SET
+            sales = sales + 1,
+            revenue = revenue + :revenue,
+            profit = profit + :profit,
+            customers = customers + :new_customers,
+            products = products + :new_products
+        WHERE month = :month
+    '''), params)
+    refresh_ratios(session, sale.month)
+
+
+def rebuild(session):
+    session.execute(text('DELETE FROM monthly_sales_customer'))
+    session.execute(text('DELETE FROM monthly_sales_product'))
+    session.execute(text('DELETE FROM monthly_sales'))
+    session.execute(text(f'''
+        INSERT INTO monthly_sales_customer (month, customer_id)
+        SELECT DISTINCT {MONTH}, customer_id FROM sale
+        WHERE customer_id IS NOT NULL
+    '''))
+    session.execute(text(f'''
+        INSERT INTO monthly_sales_product (month, product_id)
+        SELECT DISTINCT {MONTH}, sale_item.product_id
+        FROM sale JOIN sale_item ON sale_item.sale_id = sale.sale_id
+        WHERE sale_item.product_id IS NOT NULL
+    '''))
+    session.execute(text(f'''
+        INSERT INTO monthly_sales (
+            month, sales, profit, revenue, profit_margin, revenue_growth,
+            profit_growth, revenue_per_sale, profit_per_sale,
+            revenue_per_customer, profit_per_customer, revenue_per_product,
+            profit_per_product, customers, products)
+        SELECT totals.month, COUNT(*), SUM(totals.revenue - totals.cost),
+               SUM(totals.revenue), 0, 0, 0, 0, 0, 0, 0, 0, 0,
+               (SELECT COUNT(*) FROM monthly_sales_customer
+                WHERE monthly_sales_customer.month = totals.month),
+               (SELECT COUNT(*) FROM monthly_sales_product
+                WHERE monthly_sales_product.month = totals.month)
+        FROM (
+            SELECT {MONTH} AS month,
+                   COALESCE(SUM(sale_item.item_amount), 0) AS revenue,
+                   COALESCE(SUM(sale_item.unit_cost * sale_item.quantity), 0)
+                       AS cost
+            FROM sale LEFT JOIN sale_item ON sale_item.sale_id = sale.sale_id
+            GROUP BY sale.sale_id
+        ) AS totals
+        GROUP BY totals.month
+    '''))
+    refresh_ratios(session)
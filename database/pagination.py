@@ -0,0 +1,89 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import func, select
+from database.benchmarks import latency_ms, timed_calls
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(value):
+    payload = json.dumps([value]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    if not isinstance(value, int):
+        raise ValueError(f'invalid cursor {cursor!r}')
+    return value
+
+
+def serialize(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def select_fields(model, fields):
+    columns = model.__table__.columns
+    if not fields:
+        return list(columns)
+    unknown = set(fields) - set(columns.keys())
+    if unknown:
+        raise ValueError(f'unknown fields {", ".join(sorted(unknown))}')
+    return [columns[name] for name in columns.keys() if name in fields]
+
+
+def keyset_page(session, model, key, cursor=None, limit=DEFAULT_LIMIT,
+                descending=False, fields=None, filters=()):
+    columns = select_fields(model, fields)
+    query = select(key, *[column for column in columns
+                          if column.key != key.key])
+    query = query.where(*filters)
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        query = query.where(key < after if descending else key > after)
+    query = query.order_by(key.desc() if descending else key)
+    rows = session.execute(query.limit(limit + 1)).all()
+    wanted = {column.key for column in columns}
+    items = [{name: serialize(value)
+              for name, value in row._mapping.items() if name in wanted}
+             for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(rows[limit - 1][0])
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def benchmark(session, model, key, descending=False, page=10000,
+              limit=DEFAULT_LIMIT, rounds=20):
+    order = key.desc() if descending else key
+    rows = session.execute(select(func.count()).select_from(model)).scalar()
+    page = max(1, min(page, (rows - 1) // limit + 1))
+    cursor = None
+    if page > 1:
+        cursor = encode_cursor(session.execute(
+            select(key).order_by(order)
+            .offset((page - 1) * limit - 1).limit(1)).scalar())
+    offset_query = (select(*model.__table__.columns).order_by(order)
+                    .offset((page - 1) * limit).limit(limit))
+    timings = {
+        'first_page': lambda _: keyset_page(session, model, key, None,
+                                            limit, descending),
+        'deep_page': lambda _: keyset_page(session, model, key, cursor,
+                                           limit, descending),
+        'deep_offset': lambda _: session.execute(offset_query).all(),
+    }
+    report = {name: latency_ms(timed_calls(call, range(rounds)))
+              for name, call in timings.items()}
+    return dict(report, rows=rows, page=page, limit=limit)
@@ -0,0 +1,208 @@
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from database.daily_sales import SALE_WAREHOUSE
+
+LOOKBACK_DAYS = 90
+LEAD_TIME_DAYS = 7
+REVIEW_DAYS = 14
+# z-score for a 95% cycle service level.
+SERVICE_Z = 1.645
+
+PRODUCT_FILTER = ' AND {column} IN (SELECT value FROM json_each(?))'
+
+# Both levels count the same stock: what is on hand and not held for an
+# order, the figure checkout and allocation sell from.
+PRODUCTS_SQL = '''
+    SELECT product_id, stock_quantity - COALESCE((
+        SELECT SUM(warehouse_item.reserved_quantity) FROM warehouse_item
+        WHERE warehouse_item.product_id = product.product_id), 0)
+    FROM product WHERE 1
+'''
+
+WAREHOUSE_ITEMS_SQL = '''
+    SELECT product_id, warehouse_id, quantity - reserved_quantity
+    FROM warehouse_item WHERE 1
+'''
+
+# Demand is every unit that left through a sale or an order fulfilment.
+# Sales come from sale_item, which predates the ledger, and are placed in
+# the warehouse their movements name (0 when sold without one); fulfilled
+# orders only exist as ledger movements without a sale_id. Product-level
+# demand is the sum of these rows over all warehouses.
+DEMAND_SQL = f'''
+    SELECT product_id, warehouse_id, day, SUM(quantity) FROM (
+        SELECT sale_item.product_id AS product_id,
+               {SALE_WAREHOUSE} AS warehouse_id,
+               CAST(julianday(date(sale.sale_date)) - julianday(?)
+                    AS INTEGER) AS day,
+               sale_item.quantity AS quantity
+        FROM sale JOIN sale_item ON sale_item.sale_id = sale.sale_id
+        WHERE sale.sale_date >= ? AND sale_item.product_id IS NOT NULL
+        UNION ALL
+        SELECT product_id, COALESCE(warehouse_id, 0),
+               CAST(julianday(date(movement_date)) - julianday(?)
+                    AS INTEGER),
+               -quantity
+        FROM stock_movement
+        WHERE movement_type = 'sale' AND sale_id IS NULL
+        AND movement_date >= ?)
+    WHERE 1{{filter}}
+    GROUP BY product_id, warehouse_id, day
+'''
+
+UPSERT_SQL = '''
+    INSERT INTO reorder_suggestion (
+        product_id, warehouse_id, demand_rate, demand_std, on_hand,
+        safety_stock, reorder_point, order_quantity, through_sale_id,
+        through_movement_id, computed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (product_id, warehouse_id) DO UPDATE SET
+        demand_rate = excluded.demand_rate,
+        demand_std = excluded.demand_std,
+        on_hand = excluded.on_hand,
+        safety_stock = excluded.safety_stock,
+        reorder_point = excluded.reorder_point,
+        order_quantity = excluded.order_quantity,
+        through_sale_id = excluded.through_sale_id,
+        through_movement_id = excluded.through_movement_id,
+        computed_at = excluded.computed_at
+'''
+
+
+def fetch_array(cursor, sql, params, columns):
+    rows = cursor.execute(sql, params).fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, columns)
+
+
+def with_filter(sql, column, product_ids):
+    if product_ids is None:
+        return sql.format(filter=''), ()
+    return (sql.format(filter=PRODUCT_FILTER.format(column=column)),
+            ('[' + ','.join(map(str, product_ids)) + ']',))
+
+
+def pack_keys(product_ids, warehouse_ids):
+    return (product_ids << 32) | warehouse_ids
+
+
+def demand(keys, daily_keys, daily_quantities, lookback_days):
+    # Days without sales count as zero demand, so the moments are taken
+    # over the whole lookback window rather than over the sale days only.
+    rows = np.searchsorted(keys, daily_keys)
+    found = rows < len(keys)
+    found[found] = keys[rows[found]] == daily_keys[found]
+    quantities = daily_quantities[found].astype(float)
+    total = np.bincount(rows[found], weights=quantities,
+                        minlength=len(keys))
+    squares = np.bincount(rows[found], weights=quantities ** 2,
+                          minlength=len(keys))
+    rate = total / lookback_days
+    variance = np.maximum(squares / lookback_days - rate ** 2, 0)
+    return rate, np.sqrt(variance)
+
+
+def policy(rate, deviation, on_hand, lead_time_days, review_days):
+    safety = np.ceil(SERVICE_Z * deviation * np.sqrt(lead_time_days))
+    reorder_point = np.ceil(rate * lead_time_days) + safety
+    target = reorder_point + np.ceil(rate * review_days)
+    order = np.where(on_hand <= reorder_point,
+                     np.maximum(target - on_hand, 0), 0)
+    return (safety.astype(np.int64), reorder_point.astype(np.int64),
+            order.astype(np.int64))
+
+
+def daily_demand(daily, keys):
+    # Sums the (product, warehouse, day) rows into one row per key and day.
+    combined, rows = np.unique(np.column_stack((keys, daily[:, 2])),
+                               axis=0, return_inverse=True)
+    return combined[:, 0], np.bincount(rows.ravel(), weights=daily[:, 3],
+                                       minlength=len(combined))
+
+
+def suggestion_rows(keys, rate, deviation, on_hand, lead_time_days,
+                    review_days, through):
+    safety, reorder_point, order = policy(
+        rate, deviation, on_hand, lead_time_days, review_days)
+    product_ids = (keys >> 32).tolist()
+    warehouse_ids = (keys & 0xFFFFFFFF).tolist()
+    return [row + through for row in zip(
+        product_ids, warehouse_ids, rate.round(4).tolist(),
+        deviation.round(4).tolist(), on_hand.tolist(), safety.tolist(),
+        reorder_point.tolist(), order.tolist())]
+
+
+def changed_products(cursor):
+    # Products with a new sale or any new ledger movement. A hold that
+    # lapses or is released writes no movement, so its product is only
+    # refreshed by the next full run.
+    sale_watermark, movement_watermark = cursor.execute('''
+        SELECT COALESCE(MAX(through_sale_id), 0),
+               COALESCE(MAX(through_movement_id), 0)
+        FROM reorder_suggestion
+    ''').fetchone()
+    # The unary + keeps SQLite from answering DISTINCT through the
+    # product_id index instead of range-scanning the new ids.
+    return [row[0] for row in cursor.execute('''
+        SELECT DISTINCT +sale_item.product_id FROM sale_item
+        WHERE sale_item.sale_id > ? AND sale_item.product_id IS NOT NULL
+        UNION
+        SELECT DISTINCT +stock_movement.product_id FROM stock_movement
+        WHERE stock_movement.movement_id > ?
+    ''', (sale_watermark, movement_watermark)).fetchall()]
+
+
+def suggest(session, incremental=False, lookback_days=LOOKBACK_DAYS,
+            lead_time_days=LEAD_TIME_DAYS, review_days=REVIEW_DAYS):
+    started = time.perf_counter()
+    # Exactly lookback_days calendar days, today included, to match the
+    # divisor used in demand().
+    since = (datetime.utcnow().date()
+             - timedelta(days=lookback_days - 1)).isoformat()
+    connection = session.connection()
+    cursor = connection.connection.cursor()
+    try:
+        through = cursor.execute('''
+            SELECT (SELECT COALESCE(MAX(sale_id), 0) FROM sale),
+                   (SELECT COALESCE(MAX(movement_id), 0) FROM stock_movement)
+        ''').fetchone()
+        product_ids = changed_products(cursor) if incremental else None
+        if incremental and not product_ids:
+            return {'products': 0, 'warehouse_items': 0, 'to_order': 0,
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+        sql, params = with_filter(DEMAND_SQL, 'product_id', product_ids)
+        daily = fetch_array(cursor, sql, (since,) * 4 + params, 4)
+
+        sql, params = with_filter(PRODUCTS_SQL + '{filter}', 'product_id',
+                                  product_ids)
+        products = fetch_array(cursor, sql + ' ORDER BY product_id',
+                               params, 2)
+        keys = pack_keys(products[:, 0], 0)
+        rate, deviation = demand(
+            keys, *daily_demand(daily, pack_keys(daily[:, 0], 0)),
+            lookback_days)
+        rows = suggestion_rows(keys, rate, deviation, products[:, 1],
+                               lead_time_days, review_days, through)
+
+        sql, params = with_filter(WAREHOUSE_ITEMS_SQL + '{filter}',
+                                  'product_id', product_ids)
+        items = fetch_array(cursor, sql, params, 3)
+        keys = pack_keys(items[:, 0], items[:, 1])
+        order = np.argsort(keys)
+        keys, on_hand = keys[order], items[order, 2]
+        rate, deviation = demand(
+            keys, *daily_demand(daily, pack_keys(daily[:, 0], daily[:, 1])),
+            lookback_days)
+        rows += suggestion_rows(keys, rate, deviation, on_hand,
+                                lead_time_days, review_days, through)
+    finally:
+        cursor.close()
+
+    if not incremental:
+        connection.exec_driver_sql('DELETE FROM reorder_suggestion')
+    if rows:
+        connection.exec_driver_sql(UPSERT_SQL, rows)
+    return {'products': len(products), 'warehouse_items': len(items),
+            'to_order': sum(1 for row in rows if row[7]),
+            'seconds': round(time.perf_counter() - started, 3)}
@@ -0,0 +1,139 @@
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from database.database import db, Delivery, StockHold
+from database.stock_ledger import log_movement
+
+DEFAULT_TTL = timedelta(minutes=30)
+SWEEP_INTERVAL = 60
+
+
+class ReservationError(Exception):
+    pass
+
+
+def hold_lines(session, holds, ttl=DEFAULT_TTL):
+    if not holds:
+        return
+    expires_at = datetime.utcnow() + ttl
+    session.execute(insert(StockHold), [
+        {'order_item_id': order_item_id,
+         'warehouse_item_id': warehouse_item_id, 'quantity': quantity,
+         'expires_at': expires_at}
+        for order_item_id, warehouse_item_id, quantity in holds])
+    reserved = {}
+    for _, warehouse_item_id, quantity in holds:
+        reserved[warehouse_item_id] = reserved.get(
+            warehouse_item_id, 0) + quantity
+    session.execute(text('''
+        UPDATE warehouse_item
+        SET reserved_quantity = reserved_quantity + :quantity,
+            version = version + 1
+        WHERE warehouse_item_id = :warehouse_item_id
+    '''), [{'warehouse_item_id': warehouse_item_id, 'quantity': quantity}
+           for warehouse_item_id, quantity in reserved.items()])
+
+
+def release_holds(session, hold_filter, params):
+    session.execute(text(f'''
+        UPDATE warehouse_item
+        SET reserved_quantity = reserved_quantity - (
+                SELECT SUM(stock_hold.quantity) FROM stock_hold
+                WHERE stock_hold.warehouse_item_id =
+                    warehouse_item.warehouse_item_id
+                AND {hold_filter}),
+            version = version + 1
+        WHERE warehouse_item_id IN (
+            SELECT stock_hold.warehouse_item_id FROM stock_hold
+            WHERE {hold_filter})
+    '''), params)
+    session.execute(text(f'''
+        UPDATE order_item SET warehouse_id = NULL
+        WHERE order_item_id IN (
+            SELECT stock_hold.order_item_id FROM stock_hold
+            WHERE {hold_filter})
+    '''), params)
+    return session.execute(text(f'''
+        DELETE FROM stock_hold WHERE {hold_filter}
+    '''), params).rowcount
+
+
+def expire_holds(session, now=None):
+    return release_holds(session, 'stock_hold.expires_at <= :now',
+                         {'now': now or datetime.utcnow()})
+
+
+def release_order(session, order_id):
+    return release_holds(
+        session, '''stock_hold.order_item_id IN (
+            SELECT order_item_id FROM order_item
+            WHERE order_id = :order_id)''', {'order_id': order_id})
+
+
+def fulfil_order(session, order_id, delivery_status='shipped'):
+    now = datetime.utcnow()
+    lines = session.execute(text('''
+        SELECT order_item.order_item_id, order_item.product_id,
+               order_item.quantity, stock_hold.hold_id,
+               stock_hold.warehouse_item_id, stock_hold.quantity AS held,
+               stock_hold.expires_at > :now AS active,
+               warehouse_item.warehouse_id
+        FROM order_item
+        LEFT JOIN stock_hold
+            ON stock_hold.order_item_id = order_item.order_item_id
+        LEFT JOIN warehouse_item
+            ON warehouse_item.warehouse_item_id = stock_hold.warehouse_item_id
+        WHERE order_item.order_id = :order_id
+    '''), {'order_id': order_id, 'now': now}).all()
+    if not lines or any(line.hold_id is None or not line.active
+                        or line.held != line.quantity for line in lines):
+        raise ReservationError(f'order {order_id} is not fully reserved')
+    for line in lines:
+        session.execute(text('''
+            UPDATE warehouse_item
+            SET quantity = quantity - :quantity,
+                reserved_quantity = reserved_quantity - :quantity,
+                version = version + 1
+            WHERE warehouse_item_id = :warehouse_item_id
+        '''), {'quantity': line.held,
+               'warehouse_item_id': line.warehouse_item_id})
+        log_movement(session, line.product_id, -line.held, 'sale',
+                     line.warehouse_id, f'order {order_id}')
+    session.execute(text('''
+        DELETE FROM stock_hold WHERE order_item_id IN (
+            SELECT order_item_id FROM order_item WHERE order_id = :order_id)
+    '''), {'order_id': order_id})
+    delivery_id = session.execute(
+        insert(Delivery).values(order_id=order_id,
+                                delivery_status=delivery_status)
+        .returning(Delivery.delivery_id)).scalar()
+    return delivery_id, [line.product_id for line in lines]
+
+
+class HoldSweeper:
+    def __init__(self, app, interval=SWEEP_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self.expired = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='hold-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stopped.wait(self.interval):
+                session = db.session
+                try:
+                    self.expired += expire_holds(session)
+                    session.commit()
+                except Exception:
+                    session.rollback()
+                    self.app.logger.exception('Expiring stock holds failed')
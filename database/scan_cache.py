@@ -0,0 +1,168 @@
+import random
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from database.benchmarks import latency_ms, timed_calls
+from database.database import Product
+
+PENDING_EVICTIONS = 'scan_cache_evictions'
+
+
+class ScanCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._barcodes = {}
+        self._lock = threading.Lock()
+        # Every eviction advances the clock and stamps the product and
+        # barcode it touched. A miss reads the clock before querying, and
+        # put() drops its row if either stamp is newer, because a write may
+        # have committed and evicted between the query and the put.
+        self._clock = 0
+        self._floor = 0
+        self._product_stamps = {}
+        self._barcode_stamps = {}
+
+    def get(self, barcode):
+        with self._lock:
+            entry = self._entries.get(barcode)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(barcode)
+            self.hits += 1
+            return entry
+
+    def generation(self):
+        with self._lock:
+            return self._clock
+
+    def put(self, barcode, entry, generation=None):
+        with self._lock:
+            if generation is not None and self._stale(
+                    barcode, entry['product_id'], generation):
+                return
+            self._entries[barcode] = entry
+            self._entries.move_to_end(barcode)
+            self._barcodes[entry['product_id']] = barcode
+            while len(self._entries) > self.maxsize:
+                _, evicted = self._entries.popitem(last=False)
+                self._barcodes.pop(evicted['product_id'], None)
+
+    def discard(self, barcode):
+        with self._lock:
+            entry = self._entries.pop(barcode, None)
+            product_id = None
+            if entry is not None:
+                product_id = entry['product_id']
+                self._barcodes.pop(product_id, None)
+            self._stamp(product_id, barcode)
+
+    def discard_products(self, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                barcode = self._barcodes.pop(product_id, None)
+                if barcode is not None:
+                    self._entries.pop(barcode, None)
+                self._stamp(product_id, barcode)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._barcodes.clear()
+            self._clock += 1
+            self._forget_stamps()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def _stale(self, barcode, product_id, generation):
+        return (generation < self._floor
+                or self._product_stamps.get(product_id, 0) > generation
+                or self._barcode_stamps.get(barcode, 0) > generation)
+
+    def _stamp(self, product_id, barcode):
+        self._clock += 1
+        if product_id is not None:
+            self._product_stamps[product_id] = self._clock
+        if barcode is not None:
+            self._barcode_stamps[barcode] = self._clock
+        stamps = len(self._product_stamps) + len(self._barcode_stamps)
+        if stamps > self.maxsize:
+            self._forget_stamps()
+
+    def _forget_stamps(self):
+        # Keeps the stamps bounded: reads that started before this point
+        # can no longer be checked, so their puts are dropped instead.
+        self._product_stamps.clear()
+        self._barcode_stamps.clear()
+        self._floor = self._clock
+
+
+scan_cache = ScanCache()
+
+
+def lookup(session, barcode):
+    entry = scan_cache.get(barcode)
+    if entry is None:
+        generation = scan_cache.generation()
+        row = session.execute(
+            select(Product.product_id, Product.product_name, Product.price,
+                   Product.stock_quantity)
+            .where(Product.barcode == barcode)).first()
+        if row is None:
+            return None
+        entry = row._asdict()
+        scan_cache.put(barcode, entry, generation)
+    return entry
+
+
+def evict_product(target):
+    history = inspect(target).attrs.barcode.history
+    barcodes = {target.barcode, *history.deleted} - {None}
+    for barcode in barcodes:
+        scan_cache.discard(barcode)
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault(PENDING_EVICTIONS, set()).update(barcodes)
+
+
+@event.listens_for(Product, 'after_update')
+def product_updated(mapper, connection, target):
+    evict_product(target)
+
+
+@event.listens_for(Product, 'after_delete')
+def product_deleted(mapper, connection, target):
+    evict_product(target)
+
+
+@event.listens_for(Session, 'after_commit')
+def evict_committed(session):
+    for barcode in session.info.pop(PENDING_EVICTIONS, ()):
+        scan_cache.discard(barcode)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def forget_rolled_back(session, previous_transaction):
+    session.info.pop(PENDING_EVICTIONS, None)
+
+
+def benchmark(session, scans=10000, barcodes=1000):
+    sample = session.execute(
+        select(Product.barcode).where(Product.barcode.is_not(None))
+        .order_by(func.random()).limit(barcodes)).scalars().all()
+    scan_cache.clear()
+    cold = timed_calls(lambda barcode: lookup(session, barcode), sample)
+    warm = timed_calls(lambda barcode: lookup(session, barcode),
+                       random.choices(sample, k=scans) if sample else [])
+    return {'barcodes': len(sample), 'scans': len(warm),
+            'cold': latency_ms(cold), 'warm': latency_ms(warm),
+            'hit_rate': scan_cache.stats()['hit_rate']}
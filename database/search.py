@@ -0,0 +1,150 @@
+import re
+from sqlalchemy import DDL, Float, Integer, Text, event, text
+from database.benchmarks import latency_ms, timed_calls
+from database.database import Money, Product
+
+PRODUCT_FTS_DDL = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        product_name, category, description,
+        content='product', content_rowid='product_id',
+        prefix='3 4 5 6 7 8')''',
+    '''CREATE TRIGGER IF NOT EXISTS product_fts_insert
+        AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, product_name, category, description)
+        VALUES (new.product_id, new.product_name, new.category,
+                new.description);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS product_fts_delete
+        AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, product_name, category,
+                                description)
+        VALUES ('delete', old.product_id, old.product_name, old.category,
+                old.description);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS product_fts_update
+        AFTER UPDATE OF product_name, category, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, product_name, category,
+                                description)
+        VALUES ('delete', old.product_id, old.product_name, old.category,
+                old.description);
+        INSERT INTO product_fts(rowid, product_name, category, description)
+        VALUES (new.product_id, new.product_name, new.category,
+                new.description);
+    END''',
+)
+
+# Prefix queries need at least this many characters; shorter final terms
+# are matched as whole words. The prefix= index above covers the lengths
+# typed on the way to most words: FTS5 answers a longer prefix by merging
+# every matching doclist up front, which is slow for common words.
+MIN_PREFIX = 3
+# A query with a phrase matching more rows than this is searched in
+# product_name only, and when that is still too broad the shortest matching
+# names among the first CANDIDATES are returned unranked.
+CANDIDATES = 1000
+
+SEARCH_SQL = '''
+    SELECT product.product_id, product.product_name, product.price,
+           product.category, product.stock_quantity,
+           bm25(product_fts, 10.0, 5.0, 1.0) AS rank
+    FROM product_fts JOIN product ON product.product_id = product_fts.rowid
+    WHERE product_fts MATCH :match {category_filter}
+    ORDER BY rank LIMIT :limit
+'''
+
+BROAD_SEARCH_SQL = '''
+    SELECT product_id, product_name, price, category, stock_quantity,
+           NULL AS rank
+    FROM (SELECT product.* FROM product_fts
+          JOIN product ON product.product_id = product_fts.rowid
+          WHERE product_fts MATCH :match {category_filter}
+          LIMIT :candidates)
+    ORDER BY length(product_name), product_id LIMIT :limit
+'''
+
+COUNT_SQL = '''
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM product_fts WHERE product_fts MATCH :match
+        LIMIT :candidates + 1)
+'''
+
+for statement in PRODUCT_FTS_DDL:
+    event.listen(Product.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
+
+
+def install_product_search(connection):
+    definition = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE name = 'product_fts'")).scalar()
+    # SQLite stores the statement without IF NOT EXISTS; any other
+    # difference is an older prefix= setting, so the table is rebuilt.
+    current = PRODUCT_FTS_DDL[0].replace('IF NOT EXISTS ', '')
+    if definition is not None and definition.split() != current.split():
+        connection.execute(text('DROP TABLE product_fts'))
+        definition = None
+    for statement in PRODUCT_FTS_DDL:
+        connection.execute(text(statement))
+    if definition is None:
+        connection.execute(
+            text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+
+def match_phrases(query):
+    terms = re.findall(r'\w+', query)
+    phrases = [f'"{term}"' for term in terms]
+    if terms and len(terms[-1]) >= MIN_PREFIX:
+        phrases[-1] += '*'
+    return phrases
+
+
+def is_broad(session, phrases, column=''):
+    # bm25() gathers its statistics per phrase over the whole table, so one
+    # common phrase is slow to rank however few rows match them all.
+    return any(session.execute(text(COUNT_SQL), {
+        'match': column + phrase, 'candidates': CANDIDATES,
+    }).scalar() > CANDIDATES for phrase in phrases)
+
+
+def category_expression(category):
+    # Narrows the unranked candidates to the category's words; the exact
+    # category_filter in SQL still decides the match.
+    words = re.findall(r'\w+', category)
+    return f' AND {{category}} : "{" ".join(words)}"' if words else ''
+
+
+def search_products(session, query, category=None, limit=20):
+    phrases = match_phrases(query)
+    if not phrases:
+        return []
+    match, sql = ' '.join(phrases), SEARCH_SQL
+    if is_broad(session, phrases):
+        match = f'{{product_name}} : ({match})'
+        if is_broad(session, phrases, '{product_name} : '):
+            sql = BROAD_SEARCH_SQL
+    params = {'match': match, 'limit': limit, 'candidates': CANDIDATES}
+    category_filter = ''
+    if category is not None:
+        category_filter = 'AND product.category = :category'
+        params['category'] = category
+        if sql is BROAD_SEARCH_SQL:
+            params['match'] += category_expression(category)
+    statement = text(sql.format(category_filter=category_filter))
+    return session.execute(statement.columns(
+        product_id=Integer, product_name=Text, price=Money, category=Text,
+        stock_quantity=Integer, rank=Float), params).mappings().all()
+
+
+def benchmark(session, queries=200, category=None):
+    names = session.execute(text('''
+        SELECT product_name FROM product ORDER BY RANDOM() LIMIT :queries
+    '''), {'queries': queries}).scalars().all()
+    # Alternate whole words with three-letter prefixes, the way terminals
+    # query while the user is still typing.
+    terms = [word if index % 2 else word[:3]
+             for index, name in enumerate(names)
+             for word in re.findall(r'\w+', name)[:1]]
+    samples = timed_calls(
+        lambda term: search_products(session, term, category), terms)
+    return dict(latency_ms(samples), queries=len(samples),
+                products=session.execute(
+                    text('SELECT COUNT(*) FROM product')).scalar())
@@ -0,0 +1,188 @@
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.database import (Product, StockMovement, StockSnapshot,
+                               WarehouseItem)
+
+MOVEMENT_TYPES = ('receipt', 'sale', 'transfer', 'adjustment')
+UNSYNCHRONIZED = {'synchronize_session': False}
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def apply_to_product(session, product_id, quantity):
+    updated = session.execute(
+        update(Product)
+        .where(Product.product_id == product_id,
+               Product.stock_quantity + quantity >= 0)
+        .values(stock_quantity=Product.stock_quantity + quantity,
+                version=Product.version + 1)
+        .returning(Product.product_id),
+        execution_options=UNSYNCHRONIZED).scalar()
+    if updated is None:
+        if session.get(Product, product_id) is None:
+            raise ValueError(f'unknown product {product_id}')
+        raise InsufficientStock(product_id, None, quantity)
+
+
+def apply_to_warehouse(session, product_id, warehouse_id, quantity):
+    if quantity >= 0:
+        statement = sqlite_insert(WarehouseItem).values(
+            warehouse_id=warehouse_id, product_id=product_id,
+            quantity=quantity)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[WarehouseItem.warehouse_id,
+                            WarehouseItem.product_id],
+            set_={'quantity': WarehouseItem.quantity +
+                  statement.excluded.quantity,
+                  'version': WarehouseItem.version + 1}))
+        return
+    updated = session.execute(
+        update(WarehouseItem)
+        .where(WarehouseItem.warehouse_id == warehouse_id,
+               WarehouseItem.product_id == product_id,
+               WarehouseItem.quantity + quantity >=
+               WarehouseItem.reserved_quantity)
+        .values(quantity=WarehouseItem.quantity + quantity,
+                version=WarehouseItem.version + 1)
+        .returning(WarehouseItem.warehouse_item_id),
+        execution_options=UNSYNCHRONIZED).scalar()
+    if updated is None:
+        raise InsufficientStock(product_id, warehouse_id, quantity)
+
+
+def record_movement(session, product_id, quantity, movement_type,
+                    warehouse_id=None, notes=None):
+    if movement_type not in MOVEMENT_TYPES:
+        raise ValueError(f'unknown movement type {movement_type!r}')
+    if warehouse_id is None:
+        apply_to_product(session, product_id, quantity)
+    else:
+        apply_to_warehouse(session, product_id, warehouse_id, quantity)
+    return log_movement(session, product_id, quantity, movement_type,
+                        warehouse_id, notes)
+
+
+def log_movement(session, product_id, quantity, movement_type,
+                 warehouse_id=None, notes=None):
+    return session.execute(
+        insert(StockMovement).values(
+            product_id=product_id, warehouse_id=warehouse_id,
+            movement_type=movement_type, quantity=quantity, notes=notes)
+        .returning(StockMovement.movement_id)).scalar()
+
+
+def receive(session, product_id, warehouse_id, quantity, notes=None):
+    if quantity <= 0:
+        raise ValueError('receipt quantity must be positive')
+    return record_movement(session, product_id, quantity, 'receipt',
+                           warehouse_id, notes)
+
+
+def adjust(session, product_id, warehouse_id, quantity, notes=None):
+    return record_movement(session, product_id, quantity, 'adjustment',
+                           warehouse_id, notes)
+
+
+def transfer(session, product_id, from_warehouse_id, to_warehouse_id,
+             quantity, notes=None):
+    if quantity <= 0:
+        raise ValueError('transfer quantity must be positive')
+    apply_to_warehouse(session, product_id, from_warehouse_id, -quantity)
+    apply_to_warehouse(session, product_id, to_warehouse_id, quantity)
+    session.execute(insert(StockMovement), [
+        {'product_id': product_id, 'warehouse_id': from_warehouse_id,
+         'movement_type': 'transfer', 'quantity': -quantity,
+         'notes': notes},
+        {'product_id': product_id, 'warehouse_id': to_warehouse_id,
+         'movement_type': 'transfer', 'quantity': quantity, 'notes': notes},
+    ])
+
+
+def record_sale_movements(session, sale_id, lines, warehouse_id=None):
+    session.execute(insert(StockMovement), [
+        {'product_id': line[0], 'warehouse_id': warehouse_id,
+         'movement_type': 'sale', 'quantity': -line[1], 'sale_id': sale_id}
+        for line in lines])
+
+
+# Each warehouse, and the unassigned stock under NULL, is folded up to its
+# latest snapshot's movement_id, so a run only has to read the ledger past
+# the smallest of those watermarks.
+WATERMARK_SQL = '''
+    SELECT MIN(COALESCE(
+        (SELECT MAX(snapshot.movement_id) FROM stock_snapshot AS snapshot
+         WHERE snapshot.warehouse_id IS scope.warehouse_id),
+        (SELECT MIN(movement.movement_id) - 1 FROM stock_movement AS movement
+         WHERE movement.warehouse_id IS scope.warehouse_id)))
+    FROM (SELECT NULL AS warehouse_id
+          UNION ALL SELECT warehouse_id FROM warehouse) AS scope
+    WHERE {scope_filter}
+'''
+
+# Materializing the unfolded tail keeps the ledger read to a rowid range
+# scan; only those rows are grouped and matched to their latest snapshot.
+SNAPSHOT_SQL = '''
+    INSERT INTO stock_snapshot (product_id, warehouse_id, quantity,
+                                movement_id)
+    WITH pending AS MATERIALIZED (
+        SELECT movement_id, product_id, warehouse_id, quantity
+        FROM stock_movement AS movement
+        WHERE movement.movement_id > :watermark
+        {warehouse_filter})
+    SELECT pending.product_id, pending.warehouse_id,
+           COALESCE(snapshot.quantity, 0) + SUM(pending.quantity),
+           MAX(pending.movement_id)
+    FROM pending
+    LEFT JOIN stock_snapshot AS snapshot
+        ON snapshot.snapshot_id = (
+            SELECT latest.snapshot_id FROM stock_snapshot AS latest
+            WHERE latest.product_id = pending.product_id
+            AND latest.warehouse_id IS pending.warehouse_id
+            ORDER BY latest.movement_id DESC LIMIT 1)
+    WHERE pending.movement_id > COALESCE(snapshot.movement_id, 0)
+    GROUP BY pending.product_id, pending.warehouse_id
+'''
+
+
+def take_snapshots(session, warehouse_id=None):
+    scope_filter = '1'
+    warehouse_filter = ''
+    if warehouse_id is not None:
+        scope_filter = 'scope.warehouse_id = :warehouse_id'
+        warehouse_filter = 'AND movement.warehouse_id = :warehouse_id'
+    params = {'warehouse_id': warehouse_id}
+    watermark = session.execute(text(WATERMARK_SQL.format(
+        scope_filter=scope_filter)), params).scalar()
+    if watermark is None:
+        return 0
+    return session.execute(text(SNAPSHOT_SQL.format(
+        warehouse_filter=warehouse_filter)),
+        dict(params, watermark=watermark)).rowcount
+
+
+def stock_as_of(session, product_id, warehouse_id, when):
+    snapshot = session.execute(
+        select(StockSnapshot.quantity, StockSnapshot.movement_id)
+        .where(StockSnapshot.product_id == product_id,
+               StockSnapshot.warehouse_id.is_not_distinct_from(warehouse_id),
+               StockSnapshot.snapshot_date <= when)
+        .order_by(StockSnapshot.snapshot_date.desc())
+        .limit(1)).first()
+    quantity, after = snapshot if snapshot is not None else (0, 0)
+    tail = session.execute(
+        select(func.coalesce(func.sum(StockMovement.quantity), 0))
+        .where(StockMovement.product_id == product_id,
+               StockMovement.warehouse_id.is_not_distinct_from(warehouse_id),
+               StockMovement.movement_id > after,
+               StockMovement.movement_date <= when)).scalar()
+    return quantity + tail
+
+
+def product_stock_as_of(session, product_id, when):
+    warehouse_ids = session.execute(
+        select(StockMovement.warehouse_id).distinct()
+        .where(StockMovement.product_id == product_id)).scalars().all()
+    return sum(stock_as_of(session, product_id, warehouse_id, when)
+               for warehouse_id in warehouse_ids)
@@ -0,0 +1,98 @@
+from sqlalchemy import DDL, event, text
+from database.database import WarehouseItem
+from database.scan_cache import scan_cache
+
+STOCK_SYNC_TRIGGERS = ('warehouse_item_stock_insert',
+                       'warehouse_item_stock_delete',
+                       'warehouse_item_stock_update')
+STOCK_SYNC_DDL = (
+    '''CREATE TRIGGER warehouse_item_stock_insert
+        AFTER INSERT ON warehouse_item BEGIN
+        UPDATE product SET stock_quantity = stock_quantity + new.quantity,
+            version = version + 1
+        WHERE product_id = new.product_id;
+    END''',
+    '''CREATE TRIGGER warehouse_item_stock_delete
+        AFTER DELETE ON warehouse_item BEGIN
+        UPDATE product SET stock_quantity = stock_quantity - old.quantity,
+            version = version + 1
+        WHERE product_id = old.product_id;
+    END''',
+    '''CREATE TRIGGER warehouse_item_stock_update
+        AFTER UPDATE OF quantity, product_id ON warehouse_item BEGIN
+        UPDATE product SET stock_quantity = stock_quantity - old.quantity,
+            version = version + 1
+        WHERE product_id = old.product_id;
+        UPDATE product SET stock_quantity = stock_quantity + new.quantity,
+            version = version + 1
+        WHERE product_id = new.product_id;
+    END''',
+)
+
+DRIFT_SQL = '''
+    SELECT product.product_id, product.stock_quantity,
+           COALESCE((SELECT SUM(warehouse_item.quantity) FROM warehouse_item
+                     WHERE warehouse_item.product_id = product.product_id),
+                    0)
+           + COALESCE((SELECT SUM(stock_movement.quantity)
+                       FROM stock_movement
+                       WHERE stock_movement.product_id = product.product_id
+                       AND stock_movement.warehouse_id IS NULL), 0)
+               AS expected
+    FROM product
+    WHERE product.product_id > :after
+    ORDER BY product.product_id
+    LIMIT :limit
+'''
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_DRIFTS = 100
+
+for statement in STOCK_SYNC_DDL:
+    event.listen(WarehouseItem.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
+
+
+def install_stock_sync(connection):
+    for trigger in STOCK_SYNC_TRIGGERS:
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    for statement in STOCK_SYNC_DDL:
+        connection.execute(text(statement))
+
+
+def reconcile(session, fix=False, chunk_size=CHUNK_SIZE):
+    checked = 0
+    drifted = 0
+    fixed = 0
+    drifts = []
+    after = 0
+    while True:
+        rows = session.execute(text(DRIFT_SQL),
+                               {'after': after, 'limit': chunk_size}).all()
+        session.commit()
+        if not rows:
+            break
+        after = rows[-1].product_id
+        checked += len(rows)
+        chunk = [row for row in rows if row.stock_quantity != row.expected]
+        drifted += len(chunk)
+        for row in chunk[:MAX_REPORTED_DRIFTS - len(drifts)]:
+            drifts.append({'product_id': row.product_id,
+                           'stock_quantity': row.stock_quantity,
+                           'expected': row.expected})
+        if fix and chunk:
+            try:
+                for row in chunk:
+                    fixed += session.execute(text('''
+                        UPDATE product SET stock_quantity = :expected,
+                            version = version + 1
+                        WHERE product_id = :product_id
+                        AND stock_quantity = :stock_quantity
+                    '''), row._asdict()).rowcount
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            scan_cache.discard_products(row.product_id for row in chunk)
+    return {'checked': checked, 'drifted': drifted, 'fixed': fixed,
+            'drifts': drifts}
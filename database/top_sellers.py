@@ -0,0 +1,127 @@
+from datetime import datetime
+from sqlalchemy import text
+
+# Space-Saving keeps CAPACITY counters per window and scope. Any product
+# sold more than total / CAPACITY times in a window is always tracked, and
+# a tracked count overstates the true count by at most its error.
+CAPACITY = 100
+
+PERIODS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+}
+
+COUNTER = '''period = :period AND period_start = :period_start
+    AND scope = :scope AND scope_key = :scope_key'''
+
+SALE_LINES = text(f'''
+    SELECT {', '.join(f"strftime('{pattern}', sale.sale_date) AS {period}"
+                      for period, pattern in PERIODS.items())},
+           sale_item.product_id, COALESCE(product.category, '') AS category,
+           SUM(sale_item.quantity) AS quantity
+    FROM sale
+    JOIN sale_item ON sale_item.sale_id = sale.sale_id
+    LEFT JOIN product ON product.product_id = sale_item.product_id
+    WHERE sale.sale_id = :sale_id AND sale.sale_date IS NOT NULL
+    AND sale_item.product_id IS NOT NULL
+    GROUP BY sale_item.product_id
+''')
+
+
+# offer() runs for every sale line, period and scope, so its statements
+# are built once rather than per call.
+INCREMENT_OR_INSERT = text(f'''
+    INSERT INTO top_seller (period, period_start, scope, scope_key,
+                            product_id, count, error)
+    SELECT :period, :period_start, :scope, :scope_key, :product_id,
+           :quantity, 0
+    WHERE (SELECT COUNT(*) FROM top_seller WHERE {COUNTER}) < :capacity
+    OR EXISTS (SELECT 1 FROM top_seller
+               WHERE {COUNTER} AND product_id = :product_id)
+    ON CONFLICT (period, period_start, scope, scope_key, product_id)
+    DO UPDATE SET count = count + excluded.count
+''')
+
+REPLACE_SMALLEST = text(f'''
+    UPDATE top_seller
+    SET product_id = :product_id, error = count, count = count + :quantity
+    WHERE rowid = (SELECT rowid FROM top_seller WHERE {COUNTER}
+                   ORDER BY count LIMIT 1)
+''')
+
+
+def offer(connection, counter, product_id, quantity):
+    params = dict(counter, product_id=product_id, quantity=quantity,
+                  capacity=CAPACITY)
+    if not connection.execute(INCREMENT_OR_INSERT, params).rowcount:
+        connection.execute(REPLACE_SMALLEST, params)
+
+
+def scopes(line, warehouse_id):
+    yield 'all', ''
+    yield 'category', line.category
+    if warehouse_id is not None:
+        yield 'warehouse', str(warehouse_id)
+
+
+def fold_sale(session, sale_id, warehouse_id=None):
+    connection = session.connection()
+    lines = connection.execute(SALE_LINES, {'sale_id': sale_id})
+    for line in lines.all():
+        for period in PERIODS:
+            for scope, scope_key in scopes(line, warehouse_id):
+                offer(connection, {'period': period,
+                                   'period_start': getattr(line, period),
+                                   'scope': scope, 'scope_key': scope_key},
+                      line.product_id, line.quantity)
+
+
+def top(session, period='hour', period_start=None, scope='all',
+        scope_key='', limit=20):
+    if period not in PERIODS:
+        raise ValueError(f'unknown period {period}')
+    if period_start is None:
+        period_start = datetime.utcnow().strftime(PERIODS[period])
+    counter = {'period': period, 'period_start': period_start,
+               'scope': scope, 'scope_key': scope_key}
+    rows = session.execute(text(f'''
+        SELECT product_id, count, error FROM top_seller WHERE {COUNTER}
+        ORDER BY count DESC, product_id
+    '''), counter).all()
+    total = sum(row.count for row in rows)
+    # Products without a counter sold at most as often as the smallest
+    # counter once all CAPACITY counters are in use.
+    untracked = rows[-1].count if len(rows) >= CAPACITY else 0
+    threshold = rows[limit].count if len(rows) > limit else untracked
+    return dict(counter, total=total, capacity=CAPACITY,
+                untracked_max=untracked, products=[
+                    {'product_id': row.product_id, 'count': row.count,
+                     'error': row.error,
+                     'lower_bound': row.count - row.error,
+                     'guaranteed': row.count - row.error >= threshold}
+                    for row in rows[:limit]])
+
+
+def purge(session, before):
+    deleted = 0
+    for period, pattern in PERIODS.items():
+        deleted += session.execute(text('''
+            DELETE FROM top_seller
+            WHERE period = :period AND period_start < :before
+        '''), {'period': period,
+               'before': before.strftime(pattern)}).rowcount
+    return deleted
+
+
+def rebuild(session, since):
+    purge(session, datetime.max)
+    sale_ids = session.execute(text('''
+        SELECT sale.sale_id,
+               (SELECT MAX(stock_movement.warehouse_id) FROM stock_movement
+                WHERE stock_movement.sale_id = sale.sale_id) AS warehouse_id
+        FROM sale WHERE sale.sale_date >= :since
+        ORDER BY sale.sale_id
+    '''), {'since': since}).all()
+    for sale_id, warehouse_id in sale_ids:
+        fold_sale(session, sale_id, warehouse_id)
+    return len(sale_ids)
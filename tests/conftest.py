@@ -0,0 +1,60 @@
+import os
+import tempfile
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'inventory.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATABASE_PATH}'
+# Tests expire holds explicitly rather than racing a background sweeper.
+os.environ['HOLD_SWEEP_INTERVAL'] = '0'
+
+from app import app as flask_app  # noqa: E402
+from database import database, migrations, scan_cache  # noqa: E402
+
+
+def remove_database():
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        database.db.engine.dispose()
+        remove_database()
+        migrations.upgrade()
+        scan_cache.scan_cache.clear()
+        yield flask_app
+        database.db.session.remove()
+        database.db.engine.dispose()
+    remove_database()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def session(app):
+    return database.db.session
+
+
+@pytest.fixture
+def count_queries(app):
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = database.db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return counting
@@ -0,0 +1,36 @@
+import io
+from sqlalchemy import select
+from database.database import Product
+
+CATALOG = '''barcode,product_name,price
+A1,Apple,1.25
+N1,Not a number,NaN
+I1,Infinite,Infinity
+S1,Signalling,sNaN
+B1,Banana,0.40
+'''
+
+
+def test_non_finite_prices_are_rejected_lines(client, session):
+    response = client.post('/products/import', data={
+        'file': (io.BytesIO(CATALOG.encode()), 'catalog.csv')})
+
+    assert response.status_code == 200
+    assert response.json['imported'] == 2
+    assert [rejection['line'] for rejection in
+            response.json['rejections']] == [3, 4, 5]
+    barcodes = session.execute(select(Product.barcode)).scalars()
+    assert sorted(barcodes) == ['A1', 'B1']
+
+
+def test_negative_values_are_rejected_lines(client, session):
+    catalog = ('barcode,product_name,price,stock_quantity\n'
+               'A1,Apple,1.25,4\nN1,Negative price,-1,4\n'
+               'N2,Negative stock,1.00,-4\n')
+    response = client.post('/products/import', data={
+        'file': (io.BytesIO(catalog.encode()), 'catalog.csv')})
+
+    assert response.json['imported'] == 1
+    assert [rejection['error'] for rejection in
+            response.json['rejections']] == ['negative price',
+                                             'negative stock_quantity']
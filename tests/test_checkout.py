@@ -0,0 +1,107 @@
+import threading
+from database import stock_ledger
+from database.database import Product, Sale, Warehouse, WarehouseItem
+
+
+def add_product(session, product_id, stock_quantity, price='2.50'):
+    session.add(Product(product_id=product_id, product_name=f'p{product_id}',
+                        price=price, stock_quantity=stock_quantity))
+    session.commit()
+
+
+def add_warehouse_stock(session, product_id, warehouse_id, quantity):
+    session.add(Warehouse(warehouse_id=warehouse_id,
+                          warehouse_name=f'w{warehouse_id}'))
+    add_product(session, product_id, 0)
+    stock_ledger.receive(session, product_id, warehouse_id, quantity)
+    session.commit()
+
+
+def sell(client, lines, **values):
+    return client.post('/api/sales', json=dict(values, lines=[
+        {'product_id': product_id, 'quantity': quantity}
+        for product_id, quantity in lines]))
+
+
+def test_concurrent_sales_never_oversell(app, session):
+    add_product(session, 1, 50)
+    statuses = []
+    lock = threading.Lock()
+
+    def buy():
+        response = sell(app.test_client(), [(1, 2)])
+        with lock:
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=buy) for _ in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    session.expire_all()
+    assert sorted(statuses) == [201] * 25 + [409] * 15
+    assert session.get(Product, 1).stock_quantity == 0
+    assert session.query(Sale).count() == 25
+
+
+def test_failed_line_rolls_back_whole_sale(client, session):
+    add_product(session, 1, 10)
+    add_product(session, 2, 1)
+
+    response = sell(client, [(1, 3), (2, 2)])
+
+    assert response.status_code == 409
+    assert response.json['failed'] == [{'product_id': 2, 'quantity': 2}]
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 10
+    assert session.get(Product, 2).stock_quantity == 1
+    assert session.query(Sale).count() == 0
+
+
+def test_product_and_warehouse_sales_cannot_sell_units_twice(client,
+                                                             session):
+    add_warehouse_stock(session, 1, 1, 5)
+
+    statuses = [sell(client, [(1, 5)]).status_code,
+                sell(client, [(1, 5)], warehouse_id=1).status_code]
+
+    assert sorted(statuses) == [201, 409]
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 0
+    assert session.query(Sale).count() == 1
+
+
+def test_sale_without_positive_lines_is_rejected(client, session):
+    add_product(session, 1, 10)
+
+    assert sell(client, []).status_code == 400
+    assert sell(client, [(1, 0)]).status_code == 400
+    assert session.query(Sale).count() == 0
+
+
+def test_sale_with_unknown_references_is_rejected(client, session):
+    add_product(session, 1, 10)
+
+    response = sell(client, [(1, 1)], customer_id=99, user_id=99)
+
+    assert response.status_code == 400
+    assert response.json['error'] == 'unknown customer_id, user_id'
+    assert sell(client, [(1, 1)], warehouse_id=99).status_code == 400
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 10
+
+
+def test_product_sale_leaves_warehouse_and_reserved_stock(client, session):
+    add_warehouse_stock(session, 1, 1, 5)
+    session.get(WarehouseItem, 1).reserved_quantity = 3
+    stock_ledger.adjust(session, 1, None, 2)
+    session.commit()
+
+    assert sell(client, [(1, 3)]).status_code == 409
+    assert sell(client, [(1, 2)]).status_code == 201
+    assert sell(client, [(1, 3)], warehouse_id=1).status_code == 409
+    assert sell(client, [(1, 2)], warehouse_id=1).status_code == 201
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 3
+    assert session.get(WarehouseItem, 1).quantity == 3
@@ -0,0 +1,106 @@
+import random
+from datetime import datetime
+import numpy as np
+import pytest
+from sqlalchemy import insert, text
+from database import customer_sketches
+from database.customer_sketches import REGISTERS, STANDARD_ERROR
+from database.database import Customer, Product
+from database.line_items import insert_sale
+
+# Three standard errors: a correct sketch lands inside this band for all
+# but about one estimate in 370.
+TOLERANCE = 3 * STANDARD_ERROR
+
+SCOPES = [
+    ('all', '', '1'),
+    ('category', 'c1', "product.category = 'c1'"),
+    ('product', '7', 'sale_item.product_id = 7'),
+]
+RANGES = [(None, None), ('2024-05-02', '2024-05-03')]
+
+
+def sketch(ids):
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    index, rank = customer_sketches.registers_for(ids)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def relative_error(estimate, exact):
+    return abs(estimate - exact) / exact
+
+
+@pytest.mark.parametrize('customers', [10, 100, 1000, 10000, 100000])
+def test_estimate_is_within_tolerance(customers):
+    ids = np.arange(1, customers + 1)
+
+    estimate = customer_sketches.estimate(sketch(ids))
+
+    assert relative_error(estimate, customers) <= TOLERANCE
+
+
+def test_merged_sketches_count_overlap_once():
+    first = np.arange(1, 30001)
+    second = np.arange(20001, 50001)
+
+    merged = np.maximum(sketch(first), sketch(second))
+
+    assert relative_error(customer_sketches.estimate(merged),
+                          50000) <= TOLERANCE
+
+
+def seed_sales(session, customers=3000, sales=6000, seed=0):
+    session.execute(insert(Customer), [
+        {'customer_id': customer_id, 'customer_name': f'c{customer_id}'}
+        for customer_id in range(1, customers + 1)])
+    session.execute(insert(Product), [
+        {'product_id': product_id, 'product_name': f'p{product_id}',
+         'price': 1, 'stock_quantity': 0, 'category': f'c{product_id % 3}'}
+        for product_id in range(1, 11)])
+    rng = random.Random(seed)
+    for _ in range(sales):
+        sale_id = insert_sale(
+            session, [(rng.randint(1, 10), 1, 1)],
+            customer_id=rng.randint(1, customers),
+            sale_date=datetime(2024, 5, rng.randint(1, 3), 12))
+        customer_sketches.fold_sale(session, sale_id)
+    session.commit()
+
+
+def exact_customers(session, scope_filter='1', start=None, end=None):
+    return session.execute(text(f'''
+        SELECT COUNT(DISTINCT sale.customer_id)
+        FROM sale JOIN sale_item ON sale_item.sale_id = sale.sale_id
+        JOIN product ON product.product_id = sale_item.product_id
+        WHERE {scope_filter}
+        AND date(sale.sale_date) >= COALESCE(:start, '')
+        AND date(sale.sale_date) < COALESCE(:end, '9999')
+    '''), {'start': start, 'end': end}).scalar()
+
+
+def test_distinct_customers_match_exact_counts(session):
+    seed_sales(session)
+
+    for scope, scope_key, scope_filter in SCOPES:
+        for start, end in RANGES:
+            result = customer_sketches.distinct_customers(
+                session, scope, scope_key, start, end)
+            exact = exact_customers(session, scope_filter, start, end)
+            assert relative_error(result['customers'], exact) <= TOLERANCE
+
+
+def test_rebuild_reproduces_folded_sketches(session):
+    seed_sales(session, sales=500)
+    query = text('''
+        SELECT scope, scope_key, day, registers FROM customer_sketch
+        ORDER BY scope, scope_key, day
+    ''')
+    folded = [(*row[:3], customer_sketches.unpack(row[3]).tolist())
+              for row in session.execute(query)]
+
+    customer_sketches.rebuild(session)
+
+    rebuilt = [(*row[:3], customer_sketches.unpack(row[3]).tolist())
+               for row in session.execute(query)]
+    assert rebuilt == folded
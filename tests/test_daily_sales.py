@@ -0,0 +1,16 @@
+from sqlalchemy import text
+from database import daily_sales
+from tests.test_checkout import add_product, sell
+
+
+def test_benchmark_compares_revenue_and_profit(client, session):
+    add_product(session, 1, 10, price='2.50')
+    add_product(session, 2, 10, price='4.10')
+    assert sell(client, [(1, 3), (2, 1)]).status_code == 201
+
+    assert daily_sales.benchmark(session, 'day', ['product_id'])['matches']
+
+    session.execute(text('UPDATE daily_sales SET revenue = revenue + 1'))
+    assert not daily_sales.benchmark(
+        session, 'day', ['product_id'])['matches']
+    session.rollback()
@@ -0,0 +1,31 @@
+from database.database import Order
+from tests.test_checkout import add_product
+
+
+def order(client, key, **values):
+    return client.post('/api/orders', headers={'Idempotency-Key': key},
+                       json=dict(values, lines=[{'product_id': 1,
+                                                 'quantity': 2}]))
+
+
+def test_retried_order_is_replayed(client, session):
+    add_product(session, 1, 10)
+
+    first = order(client, 'order-1')
+    second = order(client, 'order-1')
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.json == first.json
+    assert session.query(Order).count() == 1
+
+
+def test_foreign_key_failure_is_not_replayed(client, session):
+    add_product(session, 1, 10)
+
+    response = order(client, 'order-1', customer_id=99)
+
+    assert response.status_code == 400
+    assert 'Idempotent-Replayed' not in response.headers
+    assert session.query(Order).count() == 0
+    assert order(client, 'order-1').status_code == 201
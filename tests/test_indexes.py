@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+from database import migrations
+
+HOT_LOOKUPS = [
+    ('SELECT * FROM sale_item WHERE sale_id = 1', 'ix_sale_item_sale_id'),
+    ('SELECT * FROM sale_item WHERE product_id = 1',
+     'ix_sale_item_product_id'),
+    ('SELECT * FROM order_item WHERE order_id = 1', 'ix_order_item_order_id'),
+    ('SELECT * FROM order_item WHERE product_id = 1',
+     'ix_order_item_product_id'),
+    ('SELECT * FROM warehouse_item WHERE warehouse_id = 1 AND product_id = 1',
+     'ix_warehouse_item_warehouse_id_product_id'),
+    ('SELECT * FROM warehouse_item WHERE product_id = 1',
+     'ix_warehouse_item_product_id'),
+    ('SELECT * FROM delivery WHERE order_id = 1', 'ix_delivery_order_id'),
+    ('SELECT * FROM sale WHERE customer_id = 1', 'ix_sale_customer_id'),
+    ('SELECT * FROM "order" WHERE customer_id = 1', 'ix_order_customer_id'),
+    ('SELECT * FROM user WHERE customer_id = 1', 'ix_user_customer_id'),
+    ("SELECT customer_id FROM sale WHERE sale_date >= '2024-01-01'",
+     'ix_sale_sale_date_customer_id'),
+    ("""SELECT customer_id FROM "order" WHERE order_date >= '2024-01-01'""",
+     'ix_order_order_date_customer_id'),
+]
+
+
+def query_plan(session, sql):
+    return [row.detail for row in
+            session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+@pytest.mark.parametrize('sql, index', HOT_LOOKUPS)
+def test_hot_lookup_uses_index(session, sql, index):
+    plan = query_plan(session, sql)
+    assert len(plan) == 1
+    assert plan[0].startswith('SEARCH')
+    assert f'INDEX {index} ' in plan[0]
+
+
+def test_warehouse_item_pair_is_unique(session):
+    indexes = session.execute(
+        text("PRAGMA index_list('warehouse_item')")).all()
+    unique = {row.name for row in indexes if row.unique}
+    assert 'ix_warehouse_item_warehouse_id_product_id' in unique
+
+
+def test_upgrade_restores_missing_indexes(session):
+    session.execute(text('DROP INDEX ix_sale_item_sale_id'))
+    session.commit()
+    migrations.upgrade()
+    plan = query_plan(session, 'SELECT * FROM sale_item WHERE sale_id = 1')
+    assert 'INDEX ix_sale_item_sale_id ' in plan[0]
@@ -0,0 +1,61 @@
+from datetime import datetime
+from functools import partial
+from sqlalchemy import text
+from database import analytics, checkout, monthly_sales
+from database.database import Customer, Product
+from database.line_items import insert_sale
+
+TABLES = ('monthly_sales', 'monthly_sales_customer', 'monthly_sales_product')
+
+
+def record_on(monkeypatch, session, sold_at, lines, customer_id=None):
+    # record_sale always stamps the current time; backdate the insert so
+    # the sale goes through the same folds as a live checkout.
+    monkeypatch.setattr(checkout, 'insert_sale',
+                        partial(insert_sale, sale_date=sold_at))
+    sale_id, failed, _ = checkout.record_sale(session, lines,
+                                              customer_id=customer_id)
+    assert sale_id is not None and not failed
+
+
+def snapshot(session):
+    return {table: session.execute(text(
+        f'SELECT * FROM {table} ORDER BY 1, 2')).all() for table in TABLES}
+
+
+def test_folded_months_match_rebuild_and_refresh(session, monkeypatch):
+    session.add_all([Customer(customer_id=customer_id,
+                              customer_name=f'c{customer_id}')
+                     for customer_id in (1, 2)])
+    session.add_all([
+        Product(product_id=1, product_name='p1', price='2.50',
+                cost_price='1.00', stock_quantity=100),
+        Product(product_id=2, product_name='p2', price='4.00',
+                cost_price='3.25', stock_quantity=100)])
+    session.commit()
+    record = partial(record_on, monkeypatch, session)
+
+    record(datetime(2024, 5, 3, 9), [(1, 2), (2, 1)], customer_id=1)
+    record(datetime(2024, 5, 20, 17), [(2, 3)], customer_id=2)
+    record(datetime(2024, 5, 21, 8), [(1, 1)])
+    record(datetime(2024, 6, 1, 12), [(1, 4)], customer_id=1)
+    session.commit()
+    growth = session.execute(text('''
+        SELECT revenue_growth FROM monthly_sales WHERE month = '2024-05'
+    ''')).scalar()
+    # Backdated into April, which must recompute May's growth.
+    record(datetime(2024, 4, 30, 23), [(2, 2)], customer_id=2)
+    session.commit()
+
+    folded = snapshot(session)
+    assert [row.month for row in folded['monthly_sales']] == [
+        '2024-04', '2024-05', '2024-06']
+    assert growth == 0 != folded['monthly_sales'][1].revenue_growth
+
+    monthly_sales.rebuild(session)
+    session.commit()
+    assert snapshot(session) == folded
+
+    analytics.refresh(session)
+    session.commit()
+    assert snapshot(session) == folded
@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import select
+from database import stock_ledger
+from database.database import Product, StockMovement, Warehouse
+from tests.test_checkout import add_product
+
+
+def patch(client, path, etag=None, **values):
+    headers = {'If-Match': f'"{etag}"'} if etag is not None else {}
+    return client.patch(path, json=values, headers=headers)
+
+
+def test_get_exposes_version_as_etag(client, session):
+    add_product(session, 1, 10)
+
+    response = client.get('/api/products/1')
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+    assert response.json['version'] == 1
+
+
+def test_patch_with_current_etag_updates_and_bumps_version(client,
+                                                           session):
+    add_product(session, 1, 10)
+
+    response = patch(client, '/api/products/1', etag=1, price='3.75',
+                     category=None, stock_quantity=12)
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"2"'
+    assert response.json['price'] == '3.75'
+    session.expire_all()
+    product = session.get(Product, 1)
+    assert (product.stock_quantity, product.category) == (12, None)
+    assert session.execute(select(StockMovement.quantity).where(
+        StockMovement.product_id == 1)).scalars().all() == [2]
+
+
+def test_patch_with_stale_etag_is_rejected(client, session):
+    add_product(session, 1, 10)
+    assert patch(client, '/api/products/1', etag=1,
+                 product_name='first').status_code == 200
+
+    response = patch(client, '/api/products/1', etag=1,
+                     product_name='second')
+
+    assert response.status_code == 412
+    session.expire_all()
+    assert session.get(Product, 1).product_name == 'first'
+
+
+@pytest.mark.parametrize('values', [
+    {'product_name': None},
+    {'product_name': ' '},
+    {'price': None},
+    {'price': 'NaN'},
+    {'price': 'Infinity'},
+    {'price': '-3.00'},
+    {'cost_price': '-0.01'},
+    {'stock_quantity': -10},
+    {'stock_quantity': 'x'},
+    {'unknown': 1},
+])
+def test_patch_rejects_invalid_values(client, session, values):
+    add_product(session, 1, 10)
+
+    response = patch(client, '/api/products/1', **values)
+
+    assert response.status_code == 400
+    session.expire_all()
+    product = session.get(Product, 1)
+    assert (product.product_name, product.version) == ('p1', 1)
+
+
+def test_warehouse_item_patch_honours_if_match(client, session):
+    session.add(Warehouse(warehouse_id=1, warehouse_name='w1'))
+    add_product(session, 1, 0)
+    stock_ledger.receive(session, 1, 1, 5)
+    session.commit()
+    path = '/api/warehouses/1/items/1'
+    etag = client.get(path).headers['ETag'].strip('"')
+
+    assert patch(client, path, etag=etag, quantity=8).status_code == 200
+    assert patch(client, path, etag=etag, quantity=3).status_code == 412
+    assert patch(client, path, quantity=-1).status_code == 400
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 8
@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import select
+from database.database import (Customer, Delivery, Order, Product, Sale,
+                               Warehouse, WarehouseItem)
+from database.line_items import insert_order, insert_sale
+
+PARENTS = 100
+
+
+@pytest.fixture
+def history(session):
+    session.add(Customer(customer_id=1, customer_name='c1'))
+    session.add(Warehouse(warehouse_id=1, warehouse_name='w1'))
+    for product_id in range(1, 4):
+        session.add(Product(product_id=product_id,
+                            product_name=f'p{product_id}', price='1.00',
+                            stock_quantity=0))
+        session.add(WarehouseItem(warehouse_id=1, product_id=product_id,
+                                  quantity=5))
+    session.flush()
+    lines = [(product_id, 1, '1.00') for product_id in range(1, 4)]
+    for _ in range(PARENTS):
+        insert_sale(session, lines, customer_id=1)
+        order_id = insert_order(session, lines, customer_id=1)
+        session.add(Delivery(order_id=order_id))
+    session.commit()
+    session.expunge_all()
+
+
+def test_sales_with_items_load_in_two_queries(history, session,
+                                              count_queries):
+    with count_queries() as statements:
+        sales = session.scalars(select(Sale)).all()
+        assert sum(len(sale.items) for sale in sales) == PARENTS * 3
+    assert len(statements) == 2
+
+
+def test_orders_with_items_and_deliveries_load_in_three_queries(
+        history, session, count_queries):
+    with count_queries() as statements:
+        orders = session.scalars(select(Order)).all()
+        assert sum(len(order.items) for order in orders) == PARENTS * 3
+        assert sum(len(order.deliveries) for order in orders) == PARENTS
+    assert len(statements) == 3
+
+
+def test_products_with_warehouses_load_in_two_queries(history, session,
+                                                      count_queries):
+    with count_queries() as statements:
+        products = session.scalars(select(Product)).all()
+        assert all(len(product.warehouses) == 1 for product in products)
+    assert len(statements) == 2
+
+
+def test_unbounded_backrefs_are_never_loaded_whole(history, session,
+                                                   count_queries):
+    product = session.get(Product, 1)
+    customer = session.get(Customer, 1)
+    with count_queries() as statements:
+        assert product.sales.count() == PARENTS
+        assert product.orders.count() == PARENTS
+        assert customer.sales.limit(5).count() == 5
+        assert customer.orders.count() == PARENTS
+    assert len(statements) == 4
+    assert all('count(*)' in statement for statement in statements)
+
+
+@pytest.mark.parametrize('path', ['/api/products', '/api/customers',
+                                  '/api/sales?limit=100',
+                                  '/api/orders?limit=100'])
+def test_listing_views_issue_one_query(history, client, count_queries,
+                                       path):
+    with count_queries() as statements:
+        assert client.get(path).status_code == 200
+    assert len(statements) == 1
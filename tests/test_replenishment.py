@@ -0,0 +1,72 @@
+from sqlalchemy import select, text
+from database import allocation, replenishment, stock_ledger
+from database.database import ReorderSuggestion
+from tests.test_checkout import add_product, sell
+from tests.test_reservations import allocated_order
+
+SUGGESTION_SQL = text('''
+    SELECT product_id, warehouse_id, demand_rate, demand_std, on_hand,
+           safety_stock, reorder_point, order_quantity
+    FROM reorder_suggestion ORDER BY product_id, warehouse_id
+''')
+
+
+def suggestion(session, product_id, warehouse_id=0):
+    return session.execute(select(ReorderSuggestion).where(
+        ReorderSuggestion.product_id == product_id,
+        ReorderSuggestion.warehouse_id == warehouse_id)).scalar_one()
+
+
+def seed_activity(client, session):
+    # Product 1 sells from warehouse 1 through checkout and a fulfilled
+    # order, then from unassigned stock; a second order stays on hold.
+    order_id = allocated_order(client, session)
+    assert sell(client, [(1, 2)], warehouse_id=1).status_code == 201
+    assert client.post(f'/api/orders/{order_id}/fulfil').status_code == 201
+    stock_ledger.adjust(session, 1, None, 5)
+    session.commit()
+    assert sell(client, [(1, 1)]).status_code == 201
+    held_id = client.post('/api/orders', json={'lines': [
+        {'product_id': 1, 'quantity': 3}]}).json['order_id']
+    allocation.allocate(session)
+    session.commit()
+    return held_id
+
+
+def test_levels_share_demand_and_stock(client, session):
+    seed_activity(client, session)
+
+    report = replenishment.suggest(session, lookback_days=10)
+    session.commit()
+
+    assert (report['products'], report['warehouse_items']) == (1, 1)
+    product, item = suggestion(session, 1), suggestion(session, 1, 1)
+    # 2 sold and 4 fulfilled from warehouse 1, 1 sold unassigned.
+    assert float(product.demand_rate) == 0.7
+    assert float(item.demand_rate) == 0.6
+    # 10 received + 5 adjusted - 7 sold, less the 3 held in warehouse 1.
+    assert (product.on_hand, item.on_hand) == (5, 1)
+
+
+def test_incremental_run_matches_full_run(client, session):
+    held_id = seed_activity(client, session)
+    add_product(session, 2, 0)
+    stock_ledger.adjust(session, 2, None, 10)
+    session.commit()
+    replenishment.suggest(session, lookback_days=10)
+    session.commit()
+
+    # Product 1 only changes through the ledger: the held order ships.
+    assert client.post(f'/api/orders/{held_id}/fulfil').status_code == 201
+    assert sell(client, [(2, 4)]).status_code == 201
+    replenishment.suggest(session, incremental=True, lookback_days=10)
+    session.commit()
+    incremental = session.execute(SUGGESTION_SQL).all()
+
+    replenishment.suggest(session, lookback_days=10)
+    session.commit()
+
+    assert incremental == session.execute(SUGGESTION_SQL).all()
+    assert suggestion(session, 2).on_hand == 6
+    item = suggestion(session, 1, 1)
+    assert (float(item.demand_rate), item.on_hand) == (0.9, 1)
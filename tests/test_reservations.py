@@ -0,0 +1,111 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database import allocation, reservations, stock_ledger
+from database.database import (Delivery, OrderItem, Product, StockHold,
+                               StockMovement, Warehouse, WarehouseItem)
+from tests.test_checkout import add_product, sell
+
+
+def allocated_order(client, session, quantity=4,
+                    ttl=reservations.DEFAULT_TTL):
+    session.add(Warehouse(warehouse_id=1, warehouse_name='w1'))
+    add_product(session, 1, 0)
+    stock_ledger.receive(session, 1, 1, 10)
+    session.commit()
+    order_id = client.post('/api/orders', json={'lines': [
+        {'product_id': 1, 'quantity': quantity}]}).json['order_id']
+    report = allocation.allocate(session, ttl=ttl)
+    session.commit()
+    assert report['allocated'] == 1
+    return order_id
+
+
+def stock(session):
+    session.expire_all()
+    item = session.get(WarehouseItem, 1)
+    return (item.quantity, item.reserved_quantity,
+            session.get(Product, 1).stock_quantity)
+
+
+def assert_released(session, order_id):
+    assert stock(session) == (10, 0, 10)
+    assert session.query(StockHold).count() == 0
+    assert session.execute(select(OrderItem.warehouse_id).where(
+        OrderItem.order_id == order_id)).scalars().all() == [None]
+
+
+def test_allocation_places_holds(client, session):
+    order_id = allocated_order(client, session)
+
+    hold = session.execute(select(StockHold)).scalar_one()
+    assert (hold.warehouse_item_id, hold.quantity) == (1, 4)
+    assert hold.expires_at > datetime.utcnow()
+    assert stock(session) == (10, 4, 10)
+    assert session.execute(select(OrderItem.warehouse_id).where(
+        OrderItem.order_id == order_id)).scalars().all() == [1]
+    assert sell(client, [(1, 7)], warehouse_id=1).status_code == 409
+
+
+def test_expiry_restores_reserved_stock(client, session):
+    order_id = allocated_order(client, session)
+
+    assert reservations.expire_holds(session) == 0
+    expired = reservations.expire_holds(
+        session, datetime.utcnow() + reservations.DEFAULT_TTL +
+        timedelta(seconds=1))
+    session.commit()
+
+    assert expired == 1
+    assert_released(session, order_id)
+    assert sell(client, [(1, 10)], warehouse_id=1).status_code == 201
+
+
+def test_release_restores_reserved_stock(client, session):
+    order_id = allocated_order(client, session)
+
+    response = client.post(f'/api/orders/{order_id}/release')
+
+    assert response.json == {'released': 1}
+    assert_released(session, order_id)
+
+
+def test_fulfil_ships_held_stock(client, session):
+    order_id = allocated_order(client, session)
+
+    response = client.post(f'/api/orders/{order_id}/fulfil')
+
+    assert response.status_code == 201
+    assert stock(session) == (6, 0, 6)
+    assert session.query(StockHold).count() == 0
+    delivery = session.get(Delivery, response.json['delivery_id'])
+    assert delivery.order_id == order_id
+    movement = session.execute(
+        select(StockMovement).where(StockMovement.movement_type == 'sale')
+    ).scalar_one()
+    assert (movement.product_id, movement.warehouse_id,
+            movement.quantity) == (1, 1, -4)
+    assert client.post(
+        f'/api/orders/{order_id}/fulfil').status_code == 409
+
+
+def test_unreserved_order_cannot_be_fulfilled(client, session):
+    order_id = allocated_order(client, session)
+    client.post(f'/api/orders/{order_id}/release')
+
+    assert client.post(f'/api/orders/{order_id}/fulfil').status_code == 409
+    assert stock(session) == (10, 0, 10)
+
+
+def test_sweeper_expires_lapsed_holds(app, client, session):
+    order_id = allocated_order(client, session, ttl=timedelta(0))
+    sweeper = reservations.HoldSweeper(app, interval=0.01).start()
+    try:
+        deadline = time.monotonic() + 5
+        while sweeper.expired == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sweeper.stop()
+
+    assert sweeper.expired == 1
+    assert_released(session, order_id)
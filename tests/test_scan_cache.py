@@ -0,0 +1,59 @@
+from database.database import Product
+from database.scan_cache import ScanCache
+
+ENTRY = {'product_id': 1, 'product_name': 'p1', 'price': '2.50',
+         'stock_quantity': 5}
+
+
+def test_put_after_concurrent_eviction_is_dropped():
+    cache = ScanCache()
+    generation = cache.generation()
+    cache.discard_products([1])
+
+    cache.put('B1', ENTRY, generation)
+
+    assert cache.get('B1') is None
+
+
+def test_put_after_barcode_eviction_is_dropped():
+    cache = ScanCache()
+    generation = cache.generation()
+    cache.discard('B1')
+
+    cache.put('B1', ENTRY, generation)
+
+    assert cache.get('B1') is None
+
+
+def test_put_survives_evictions_of_other_products():
+    cache = ScanCache()
+    generation = cache.generation()
+    cache.discard_products([2])
+
+    cache.put('B1', ENTRY, generation)
+
+    assert cache.get('B1') == ENTRY
+
+
+def test_forgotten_stamps_drop_older_reads():
+    cache = ScanCache(maxsize=2)
+    generation = cache.generation()
+    cache.discard_products([2, 3, 4])
+
+    cache.put('B1', ENTRY, generation)
+
+    assert cache.get('B1') is None
+    cache.put('B1', ENTRY, cache.generation())
+    assert cache.get('B1') == ENTRY
+
+
+def test_scan_reflects_committed_sale(client, session):
+    session.add(Product(product_id=1, product_name='p1', price='2.50',
+                        stock_quantity=5, barcode='B1'))
+    session.commit()
+    assert client.get('/scan/B1').json['stock_quantity'] == 5
+
+    client.post('/api/sales', json={
+        'lines': [{'product_id': 1, 'quantity': 2}]})
+
+    assert client.get('/scan/B1').json['stock_quantity'] == 3
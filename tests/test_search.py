@@ -0,0 +1,68 @@
+from sqlalchemy import insert, text
+from database import search
+from database.database import Product
+
+
+def add_products(session, names, category='fruit', description=None):
+    start = session.query(Product).count() + 1
+    session.execute(insert(Product), [
+        {'product_id': product_id, 'product_name': name, 'price': 1,
+         'stock_quantity': 0, 'category': category,
+         'description': description}
+        for product_id, name in enumerate(names, start)])
+    session.commit()
+
+
+def names(results):
+    return [result['product_name'] for result in results]
+
+
+def test_short_final_terms_are_not_prefixes():
+    assert search.match_phrases('ap') == ['"ap"']
+    assert search.match_phrases('red app') == ['"red"', '"app"*']
+    assert search.match_phrases('  ') == []
+
+
+def test_search_ranks_and_filters(session):
+    add_products(session, ['apple juice', 'green apple'])
+    add_products(session, ['apple pie'], category='bakery')
+    add_products(session, ['pear'], category='misc',
+                 description='goes with apple')
+
+    assert names(search.search_products(session, 'appl'))[-1] == 'pear'
+    assert names(search.search_products(session, 'ap')) == []
+    fruit = search.search_products(session, 'apple', category='fruit')
+    assert sorted(names(fruit)) == ['apple juice', 'green apple']
+
+
+def test_broad_terms_fall_back_to_names(session, monkeypatch):
+    monkeypatch.setattr(search, 'CANDIDATES', 2)
+    add_products(session, ['pear'], description='apple')
+    add_products(session, ['apple', 'apple tart'])
+
+    # Two name matches: ranked, description-only matches dropped.
+    results = search.search_products(session, 'apple')
+    assert names(results) == ['apple', 'apple tart']
+    assert all(result['rank'] is not None for result in results)
+
+    add_products(session, ['apple sauce'], category='jar')
+    # Three: the first two candidates come back unranked, shortest first.
+    results = search.search_products(session, 'apple')
+    assert names(results) == ['apple', 'apple tart']
+    assert all(result['rank'] is None for result in results)
+    assert names(search.search_products(
+        session, 'apple', category='jar')) == ['apple sauce']
+
+
+def test_upgrade_rebuilds_older_prefix_index(session):
+    add_products(session, ['apple'])
+    connection = session.connection()
+    connection.execute(text('DROP TABLE product_fts'))
+    connection.execute(text(search.PRODUCT_FTS_DDL[0].replace(
+        "prefix='3 4 5 6 7 8'", "prefix='2 3'")))
+    search.install_product_search(connection)
+    session.commit()
+
+    assert "prefix='3 4 5 6 7 8'" in session.execute(text(
+        "SELECT sql FROM sqlite_master WHERE name = 'product_fts'")).scalar()
+    assert names(search.search_products(session, 'appl')) == ['apple']
@@ -0,0 +1,99 @@
+from sqlalchemy import func, select, text
+from database import stock_ledger
+from database.database import Product, StockMovement, Warehouse
+from tests.test_indexes import query_plan
+
+
+def add_stock(session):
+    session.add(Product(product_id=1, product_name='p1', price='1.00',
+                        stock_quantity=100))
+    session.add_all([Warehouse(warehouse_id=warehouse_id,
+                               warehouse_name=f'w{warehouse_id}')
+                     for warehouse_id in (1, 2)])
+    session.commit()
+
+
+def latest_snapshots(session):
+    return {(row.product_id, row.warehouse_id): row.quantity
+            for row in session.execute(text('''
+                SELECT product_id, warehouse_id, quantity
+                FROM stock_snapshot AS snapshot
+                WHERE movement_id = (
+                    SELECT MAX(latest.movement_id)
+                    FROM stock_snapshot AS latest
+                    WHERE latest.product_id = snapshot.product_id
+                    AND latest.warehouse_id IS snapshot.warehouse_id)
+            '''))}
+
+
+def ledger_totals(session):
+    return {(row.product_id, row.warehouse_id): row.quantity
+            for row in session.execute(
+                select(StockMovement.product_id, StockMovement.warehouse_id,
+                       func.sum(StockMovement.quantity).label('quantity'))
+                .group_by(StockMovement.product_id,
+                          StockMovement.warehouse_id))}
+
+
+def test_snapshots_fold_only_unfolded_movements(session):
+    add_stock(session)
+    stock_ledger.receive(session, 1, 1, 10)
+    stock_ledger.receive(session, 1, 2, 20)
+    stock_ledger.adjust(session, 1, None, -5)
+    assert stock_ledger.take_snapshots(session) == 3
+
+    stock_ledger.receive(session, 1, 1, 7)
+    stock_ledger.transfer(session, 1, 2, 1, 4)
+    stock_ledger.adjust(session, 1, None, 2)
+    # A single-warehouse run moves that warehouse's watermark ahead of the
+    # others; the next full run must still pick up their movements.
+    assert stock_ledger.take_snapshots(session, warehouse_id=1) == 1
+    assert stock_ledger.take_snapshots(session) == 2
+    assert stock_ledger.take_snapshots(session) == 0
+
+    assert latest_snapshots(session) == ledger_totals(session) == {
+        (1, 1): 21, (1, 2): 16, (1, None): -3}
+
+
+def test_snapshot_reads_only_the_ledger_tail(session):
+    for warehouse_filter in ('', 'AND movement.warehouse_id = 1'):
+        plan = query_plan(session, stock_ledger.SNAPSHOT_SQL.format(
+            warehouse_filter=warehouse_filter).replace(':watermark', '0'))
+        assert not any(step.startswith('SCAN movement') for step in plan)
+        assert any('INDEX ix_stock_snapshot_product_id_warehouse_id_'
+                   'movement_id ' in step for step in plan)
+
+
+def move(client, **values):
+    return client.post('/api/stock/movements', json=values)
+
+
+def test_movement_endpoint_rejects_unknown_references(client, session):
+    add_stock(session)
+
+    assert move(client, product_id=1, quantity=5, movement_type='receipt',
+                warehouse_id=7).status_code == 400
+    assert move(client, product_id=1, quantity=5, movement_type='receipt',
+                warehouse_id='x').status_code == 400
+    assert move(client, product_id=1, quantity=5, movement_type='transfer',
+                warehouse_id=1, to_warehouse_id=7).status_code == 400
+    assert move(client, product_id=1, quantity=5, movement_type='transfer',
+                to_warehouse_id=1).status_code == 400
+    assert move(client, product_id=99, quantity=-1,
+                movement_type='adjustment').status_code == 404
+    assert session.query(StockMovement).count() == 0
+
+
+def test_movement_endpoint_records_moves(client, session):
+    add_stock(session)
+
+    assert move(client, product_id=1, quantity=5, movement_type='receipt',
+                warehouse_id='1').status_code == 201
+    assert move(client, product_id=1, quantity=2, movement_type='transfer',
+                warehouse_id=1, to_warehouse_id=2).status_code == 201
+    assert move(client, product_id=1, quantity=-200,
+                movement_type='adjustment').status_code == 409
+
+    assert ledger_totals(session) == {(1, 1): 3, (1, 2): 2}
+    session.expire_all()
+    assert session.get(Product, 1).stock_quantity == 105
@@ -0,0 +1,91 @@
+import random
+from datetime import datetime
+import pytest
+from sqlalchemy import insert, text
+from database import top_sellers
+from database.database import Product
+from database.line_items import insert_sale
+
+SOLD_AT = datetime(2024, 5, 1, 10, 15)
+HOUR = '2024-05-01 10:00'
+
+
+def seed_sales(session, products, sales, seed=0):
+    # Demand falls off as 1 / rank, so a few products dominate the window.
+    session.execute(insert(Product), [
+        {'product_id': product_id, 'product_name': f'p{product_id}',
+         'price': 1, 'stock_quantity': 0,
+         'category': 'even' if product_id % 2 == 0 else 'odd'}
+        for product_id in range(1, products + 1)])
+    rng = random.Random(seed)
+    product_ids = list(range(1, products + 1))
+    weights = [1 / rank for rank in product_ids]
+    for product_id in rng.choices(product_ids, weights, k=sales):
+        sale_id = insert_sale(session, [(product_id, rng.randint(1, 3), 1)],
+                              sale_date=SOLD_AT)
+        top_sellers.fold_sale(session, sale_id)
+    session.commit()
+
+
+def exact_counts(session, category=None):
+    return dict(session.execute(text('''
+        SELECT sale_item.product_id, SUM(sale_item.quantity)
+        FROM sale_item JOIN product USING (product_id)
+        WHERE :category IS NULL OR product.category = :category
+        GROUP BY sale_item.product_id
+    '''), {'category': category}).all())
+
+
+def report(session, scope='all', scope_key='', limit=20):
+    return top_sellers.top(session, 'hour', HOUR, scope, scope_key, limit)
+
+
+def test_counts_are_exact_under_capacity(session):
+    seed_sales(session, top_sellers.CAPACITY // 2, 500)
+
+    result = report(session, limit=top_sellers.CAPACITY)
+
+    exact = exact_counts(session)
+    assert {product['product_id']: product['count']
+            for product in result['products']} == exact
+    assert all(product['error'] == 0 for product in result['products'])
+    assert result['total'] == sum(exact.values())
+
+
+@pytest.mark.parametrize('scope, scope_key, category', [
+    ('all', '', None),
+    ('category', 'odd', 'odd'),
+])
+def test_bounds_hold_over_capacity(session, scope, scope_key, category):
+    seed_sales(session, 5 * top_sellers.CAPACITY, 2000)
+
+    result = report(session, scope, scope_key, limit=top_sellers.CAPACITY)
+
+    exact = exact_counts(session, category)
+    total = sum(exact.values())
+    tracked = {product['product_id']: product
+               for product in result['products']}
+    assert len(tracked) == top_sellers.CAPACITY < len(exact)
+    assert result['total'] == total
+    for product_id, product in tracked.items():
+        assert (product['lower_bound'] <= exact.get(product_id, 0)
+                <= product['count'])
+    for product_id, count in exact.items():
+        if count > total / top_sellers.CAPACITY:
+            assert product_id in tracked
+        if product_id not in tracked:
+            assert count <= result['untracked_max']
+
+
+def test_guaranteed_products_are_true_top_sellers(session):
+    seed_sales(session, 5 * top_sellers.CAPACITY, 2000)
+    limit = 10
+
+    result = report(session, limit=limit)
+
+    exact = exact_counts(session)
+    cutoff = sorted(exact.values(), reverse=True)[limit - 1]
+    guaranteed = [product['product_id'] for product in result['products']
+                  if product['guaranteed']]
+    assert guaranteed
+    assert all(exact[product_id] >= cutoff for product_id in guaranteed)